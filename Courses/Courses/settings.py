@@ -6,12 +6,10 @@ from django.utils.translation import ugettext_lazy as _
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'temps/')
-"""
+
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static"),
-    '/var/www/static/',
 ]
-"""
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
@@ -27,7 +25,9 @@ ALLOWED_HOSTS = []
 
 CKEDITOR_UPLOAD_PATH = "uploads/"
 
-CKEDITOR_FILENAME_GENERATOR = 'help.get_filename'
+# one file per distinct content, see website/uploads.py
+CKEDITOR_STORAGE_BACKEND = 'website.uploads.ContentAddressedStorage'
+CKEDITOR_RESTRICT_BY_DATE = False
 
 CKEDITOR_CONFIGS = {
     'default':{
@@ -55,9 +55,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'website',
     'ckeditor',
+    'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'website.metrics.MetricsMiddleware',
+    'website.db.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -96,9 +99,69 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Read replicas of 'default' used for the catalog models, see website/db.py.
+# Add them to DATABASES first, e.g. a file copy for local testing:
+#   DATABASES['replica1'] = dict(DATABASES['default'],
+#                                NAME=os.path.join(BASE_DIR, 'replica1.sqlite3'))
+#   DATABASE_REPLICAS = ['replica1']
+
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['website.db.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 268435456,
+    'cache_size': -20000,
+}
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Use a shared backend (memcached/redis) in production so the reference
+# data version keys are seen by every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+REFDATA_CACHE = 'default'
+
+# Sessions in cache + DB behind a per-process LRU, see website/sessions.py
+
+SESSION_ENGINE = 'website.sessions'
+SESSION_LOCAL_CACHE_SIZE = 1000
+SESSION_LOCAL_CACHE_TTL = 5
+
+# Request user and "My Courses" menu from the cache, see website/usercache.py
+
+AUTHENTICATION_BACKENDS = [
+    'website.backends.CachedModelBackend',
+    # sessions created before the cached backend
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE = 'default'
+USER_CACHE_TIMEOUT = 300
+
+# Read-only API, see website/api.py
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+}
+
+# Course search backend, see website/search.py
+
+SEARCH_BACKEND = 'website.search.SQLiteFTSBackend'
+
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
 ]
@@ -150,11 +213,34 @@ LOCALE_PATHS = [
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# collectstatic output: hashed names with .gz/.br siblings, see
+# website/staticfiles.py
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'website.staticfiles.CompressedManifestStaticFilesStorage'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 
+# Request metrics, see website/metrics.py
+# METRICS_DIR gathers the numbers of every worker process,
+# METRICS_TOKEN lets a scraper in without a staff session
+
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 10
+METRICS_TOKEN = None
+
+
+# Course.files downloads, see website/downloads.py
+# The files live outside MEDIA_ROOT so only courseFiles serves them.
+# 'X-Accel-Redirect' (nginx, internal location DOWNLOADS_ACCEL_PREFIX
+# aliased to PROTECTED_MEDIA_ROOT) or 'X-Sendfile', None to stream from Django
+
+PROTECTED_MEDIA_ROOT = os.path.join(BASE_DIR, 'protected')
+
+DOWNLOADS_SENDFILE_HEADER = None
+DOWNLOADS_ACCEL_PREFIX = '/protected/'
+
+
 # Emailing settings
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -1,18 +1,28 @@
 from django.conf import settings
 from django.conf.urls.static import static
-from django.urls import path
+from django.urls import path, re_path
 from django.conf.urls.i18n import i18n_patterns
 from django.conf.urls import include
-from website.views import attend 
+from website.api import router as api_router
+from website.metrics import metrics
+from website.staticfiles import serve as serve_static
+from website.uploads import BLOB_PATH, UPLOAD_PATH, serve as serve_upload
+from website.views import attend, attend_batch
 
 # -----------Translation With i18n and ajax---------------
 
 
 urlpatterns = [
-    path('attend/', attend, name='attend_url'),
+    path('attend/<int:lesson_id>', attend, name='attend_url'),
+    path('attend/batch/', attend_batch, name='attend_batch'),
+    path('api/', include(api_router.urls)),
+    path('metrics', metrics, name='metrics'),
     path(r'ckeditor/', include('ckeditor_uploader.urls')),
     ]
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+urlpatterns += [re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'),
+                        serve_static)]
+urlpatterns += [re_path(r'^%s%s(?P<path>%s)$' % (
+    settings.MEDIA_URL.lstrip('/'), UPLOAD_PATH, BLOB_PATH), serve_upload)]
 urlpatterns += i18n_patterns(path('', include('website.urls')))
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
@@ -1,11 +1,67 @@
 from django.contrib import admin
-from . import models
+from . import coursepack, forms, models, newsletter, search
+from .db import estimated_count
+from django.contrib import messages
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
 from django.contrib.auth.admin import UserAdmin
-from django.urls import reverse
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.admin import UserAdmin
 
 
+# Changelist helpers
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using an estimated count for an unfiltered big table"""
+    threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            estimate = estimated_count(self.object_list.model,
+                                       self.object_list.db)
+            if estimate > self.threshold:
+                return estimate
+        return super().count
+
+
+class SlicedRelatedFilter(admin.RelatedFieldListFilter):
+    """Related filter listing only the first `limit` objects (plus the
+    selected one) instead of the whole related table"""
+    limit = 30
+
+    def field_choices(self, field, request, model_admin):
+        queryset = (field.related_model._default_manager
+                    .complex_filter(field.get_limit_choices_to()))
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        objects = list(queryset[:self.limit])
+        if (self.lookup_val and self.lookup_val.isdigit() and
+                all(str(obj.pk) != self.lookup_val for obj in objects)):
+            objects += list(queryset.filter(pk=self.lookup_val))
+        return [(obj.pk, str(obj)) for obj in objects]
+
+
+class ScopedAutocomplete(AutocompleteSelectMultiple):
+    """Autocomplete widget loading its options from `url`"""
+
+    def __init__(self, url, *args, **kwargs):
+        self.url = url
+        super().__init__(*args, **kwargs)
+
+    def get_url(self):
+        return self.url
+
+
 # Inline Admin Classes
 
 class UnitInline(admin.TabularInline):
@@ -73,10 +129,75 @@ class QuizInline(admin.TabularInline):
 @admin.register(models.Rel)
 class RELAdmin(admin.ModelAdmin):
     list_display = ['id', 'student', 'course', 'join_date', 'rel_type']
-    list_filter = ['rel_type', 'course']
+    list_filter = ['rel_type', ('course', SlicedRelatedFilter)]
+    list_select_related = ['student', 'course']
+    autocomplete_fields = ['student', 'course']
+    search_fields = ['student__email', 'course__title']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    course_fields = ['lessons_attended', 'quizzes_solved']
+    choices_per_page = 20
+
+    def course_choices(self, field, course_id):
+        """Lessons or quizzes of the course, labels in the same query"""
+        if field == 'lessons_attended':
+            return (models.Lesson.objects.filter(unit__course=course_id)
+                    .select_related('unit').order_by('unit__arrange', 'arrange'))
+        return (models.Quiz.objects.filter(unit__course=course_id)
+                .order_by('unit__arrange', 'id'))
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            prefetch_related_objects([obj], *(
+                Prefetch(f, self.course_choices(f, obj.course_id))
+                for f in self.course_fields))
+        return obj
+
+    def get_exclude(self, request, obj=None):
+        # attendance only makes sense once the course is known
+        return self.course_fields if obj is None else super().get_exclude(request, obj)
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        for name in self.course_fields:
+            field = form.base_fields.get(name)
+            if obj is None or field is None:
+                continue
+            field.queryset = self.course_choices(name, obj.course_id)
+            field.widget = ScopedAutocomplete(
+                reverse('admin:website_rel_choices', args=[obj.pk, name]),
+                models.Rel._meta.get_field(name).remote_field, self.admin_site)
+        return form
+
+    def get_urls(self):
+        return [
+            path('<int:rel_id>/choices/<str:field>/',
+                 self.admin_site.admin_view(self.choices_view),
+                 name='website_rel_choices'),
+        ] + super().get_urls()
+
+    def choices_view(self, request, rel_id, field):
+        """select2 JSON of the lessons or quizzes of the enrollment's course"""
+        if field not in self.course_fields:
+            raise Http404
+        rel = get_object_or_404(models.Rel.objects.only('course'), pk=rel_id)
+        if not self.has_view_permission(request, rel):
+            raise PermissionDenied
+        queryset = self.course_choices(field, rel.course_id)
+        term = request.GET.get('term', '').strip()
+        if term:
+            lookup = 'name' if field == 'lessons_attended' else 'question'
+            queryset = queryset.filter(**{lookup + '__icontains': term})
+        page = Paginator(queryset, self.choices_per_page).get_page(
+            request.GET.get('page'))
+        return JsonResponse({
+            'results': [{'id': str(obj.pk), 'text': str(obj)} for obj in page],
+            'pagination': {'more': page.has_next()},
+        })
 
     def get_readonly_fields(self, request, obj=None):
-        if request.user.is_superuser or (obj is None) or (request.user is obj.course.instructor):
+        if request.user.is_superuser or (obj is None) or (request.user.pk == obj.course.instructor_id):
             return ['student', 'course']
         else:
             return ['student', 'course', 'rel_type', 'lessons_attended', 'quizzes_solved', 'rating', 'feedback', 'join_date']
@@ -87,8 +208,11 @@ class UnitAdmin(admin.ModelAdmin):
     inlines = [LessonInline, QuizInline]
     exclude = ['arrange']
     search_fields = ['name', 'desc']
-    list_filter = ['course']
+    list_filter = [('course', SlicedRelatedFilter)]
     list_display = ['id', 'name', 'course']
+    list_select_related = ['course']
+    autocomplete_fields = ['course']
+    show_full_result_count = False
     fieldsets = (
         (None, {
             "fields": (
@@ -102,12 +226,25 @@ class UnitAdmin(admin.ModelAdmin):
 
 
 def approve(modeladmin, request, queryset):
+    # the changelist filter may be is_approved=False, read the pks first
+    pks = list(queryset.values_list('pk', flat=True))
     queryset.update(is_approved=True)
+    search.backend().index_courses(models.Course.objects.filter(pk__in=pks))
 
 
 approve.short_description = _('Approve Course')
 
 
+def export_courses(modeladmin, request, queryset):
+    response = StreamingHttpResponse(coursepack.export_courses(queryset),
+                                     content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="courses.ndjson"'
+    return response
+
+
+export_courses.short_description = _('Export Courses')
+
+
 def not_staff(modeladmin, request, queryset):
     if request.user.is_superuser:
         queryset.update(is_staff=False)
@@ -118,14 +255,18 @@ not_staff.short_description = _('disable staff')
 
 @admin.register(models.Course)
 class CourseAdmin(admin.ModelAdmin):
-    actions = [approve]
+    actions = [approve, export_courses]
     date_hierarchy = 'pub_date'
     inlines = [UnitInline,]
     list_display = ['title', 'instructor', 'get_lessons_num', 'is_approved']
+    list_select_related = ['instructor', 'stats']
     ordering = ['pub_date']
-    list_filter = ['instructor', 'category',
-                   'skills_covered', 'is_approved', 'level']
-    search_fields = ['title', 'skills_covered']
+    list_filter = [('instructor', SlicedRelatedFilter), 'category',
+                   ('skills_covered', SlicedRelatedFilter), 'is_approved',
+                   'level']
+    search_fields = ['title', 'skills_covered__name']
+    raw_id_fields = ['instructor']
+    show_full_result_count = False
     filter_horizontal = ['tags', 'skills_covered']
     prepopulated_fields = {'slug': ('title',)}
     fieldsets = ((None,
@@ -154,6 +295,37 @@ class CourseAdmin(admin.ModelAdmin):
             return []
         return list_ro
 
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view),
+                 name='website_course_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Import an export_course file, as the current user"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = forms.CourseImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            instructor = None if request.user.is_superuser else request.user
+            try:
+                courses = coursepack.import_courses(
+                    form.cleaned_data['file'], instructor)
+            except coursepack.CoursePackError as e:
+                form.add_error('file', str(e))
+            else:
+                self.message_user(request, _('%(count)d courses imported: '
+                                             '%(slugs)s') % {
+                    'count': len(courses),
+                    'slugs': ', '.join(c.slug for c in courses)},
+                    messages.SUCCESS)
+                return redirect('admin:website_course_changelist')
+        context = dict(self.admin_site.each_context(request),
+                       title=_('Import Courses'), form=form,
+                       opts=self.model._meta)
+        return TemplateResponse(request, 'admin/website/course/import.html',
+                                context)
+
 
 @admin.register(models.Level)
 class LevelAdmin(admin.ModelAdmin):
@@ -198,6 +370,16 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+@admin.register(models.Upload)
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'refs', 'uploaded']
+    search_fields = ['digest']
+    readonly_fields = ['digest', 'name', 'size', 'refs', 'uploaded']
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(models.NewsTeller)
 class NewsTellerAdmin(admin.ModelAdmin):
     list_display = ['id', 'email', 'is_subscribe']
@@ -213,8 +395,19 @@ class NewsTellerAdmin(admin.ModelAdmin):
             return['is_subscribe']
 
 
+def SEND_EMAIL(modeladmin, request, queryset):
+    for message in queryset:
+        newsletter.queue(message)
+    modeladmin.message_user(request, _('Queued, the send_newsletter command '
+                                       'will send it'))
+
+
+SEND_EMAIL.short_description = _('Send Email')
+
+
 @admin.register(models.NewsTeller_Emails)
 class NewsTeller_EmailsAdmin(admin.ModelAdmin):
+    actions = [SEND_EMAIL]
     list_display = ['id', 'subject']
     search_fields = ['subject']
     list_display_links = ['id', 'subject']
@@ -229,15 +422,19 @@ class NewsTeller_EmailsAdmin(admin.ModelAdmin):
 @admin.register(models.Lesson)
 class LessonAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'unit']
-    search_fields = ['name', 'desc']
+    list_select_related = ['unit']
+    autocomplete_fields = ['unit']
+    search_fields = ['name']
     list_display_links = ['id', 'name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     exclude = ['arrange']
 
     def get_readonly_fields(self, request, obj=None):
         ro = ['unit']
         if request.user.is_superuser:
             return ro
-        elif obj and obj.unit.course.instructor is request.user:
+        elif obj and obj.unit.course.instructor_id == request.user.pk:
             return ro
         elif not obj:
             return []
@@ -256,11 +453,6 @@ def NOT_STAFF(modeladmin, request, queryset):
 not_staff.short_description = _('desactive staff')
 
 
-def SEND_EMAIL(modeladmin, request, queryset):
-    print('Send Email')
-
-
-SEND_EMAIL.short_description = _('Send Email')
 
 
 class CustomUserAdmin(UserAdmin):
@@ -268,6 +460,9 @@ class CustomUserAdmin(UserAdmin):
     list_display = ('email', 'is_active', 'is_staff', 'is_male')
     actions = [not_staff]
     list_filter = ('is_male', 'is_instructor')
+    search_fields = ('email', 'first_name', 'last_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     readonly_fields = ['pic_tag']
 
@@ -0,0 +1,84 @@
+"""Read-only JSON API used by the mobile app.
+
+Every list is keyset (cursor) paginated and fetches its relations with
+select_related/prefetch_related, so a page costs the same number of queries
+whatever its size. Responses carry an ETag and honour If-None-Match.
+"""
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, set_response_etag
+from rest_framework import permissions, routers, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from . import models, serializers
+
+
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ETagMixin:
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            response.render()
+            set_response_etag(response)
+            response = get_conditional_response(
+                request, etag=response['ETag'], response=response)
+        return response
+
+
+class ReadOnlyViewSet(ETagMixin, viewsets.ReadOnlyModelViewSet):
+    pagination_class = IdCursorPagination
+
+    def requested(self, field):
+        fields = self.request.query_params.get('fields')
+        return not fields or field in fields.split(',')
+
+
+class CategoryViewSet(ReadOnlyViewSet):
+    queryset = models.Category.objects.defer('desc', 'desc_plain')
+    serializer_class = serializers.CategorySerializer
+    lookup_field = 'slug'
+
+
+class CourseViewSet(ReadOnlyViewSet):
+    serializer_class = serializers.CourseSerializer
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        qs = models.Course.objects.approved().select_related(
+            'category', 'instructor', 'language', 'level', 'stats').defer(
+                'intro_text', 'intro_text_plain')
+        for field in ('tags', 'skills_covered'):
+            if self.requested(field):
+                qs = qs.prefetch_related(field)
+        category = self.request.query_params.get('category')
+        if category:
+            qs = qs.filter(category__slug=category)
+        return qs
+
+    @action(detail=True)
+    def outline(self, request, slug=None):
+        course = get_object_or_404(models.Course.objects.approved(), slug=slug)
+        return Response(serializers.UnitOutlineSerializer(
+            course.get_outline(), many=True).data)
+
+
+class EnrollmentViewSet(ReadOnlyViewSet):
+    serializer_class = serializers.EnrollmentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return models.Rel.objects.dashboard(self.request.user)
+
+
+router = routers.DefaultRouter()
+router.register('categories', CategoryViewSet)
+router.register('courses', CourseViewSet, basename='course')
+router.register('enrollments', EnrollmentViewSet, basename='enrollment')
@@ -5,3 +5,6 @@ from django.utils.translation import ugettext_lazy as _
 class WebsiteConfig(AppConfig):
     name = 'website'
     verbose_name = _('Website')
+
+    def ready(self):
+        from . import db, signals  # noqa: F401
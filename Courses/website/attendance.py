@@ -0,0 +1,34 @@
+"""Bulk recording of attended lessons.
+
+`record` resolves any number of lesson ids to the student's enrollments
+with one query and writes the M2M rows with one INSERT that ignores rows
+already present, so repeated or concurrent submissions are harmless.
+"""
+from django.utils import timezone
+
+from . import models
+
+MAX_BATCH = 500
+
+
+def record(student, lesson_ids):
+    """Mark `lesson_ids` attended for `student`.
+
+    Returns (recorded, rejected): the lesson ids written (or already
+    attended) and the ones that are unknown or not in an enrolled course.
+    """
+    lesson_ids = set(lesson_ids)
+    rows = (models.Lesson.objects
+            .filter(pk__in=lesson_ids, unit__course__details__student=student)
+            .values_list('pk', 'unit__course__details'))
+    through = models.Rel.lessons_attended.through
+    links = [through(rel_id=rel_id, lesson_id=lesson_id)
+             for lesson_id, rel_id in rows]
+    if links:
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        # bulk_create sends no m2m_changed, let progress rebuild lazily
+        models.Rel.objects.filter(
+            pk__in={link.rel_id for link in links}).update(
+                progress_version=0, last_activity=timezone.now())
+    recorded = {link.lesson_id for link in links}
+    return recorded, lesson_ids - recorded
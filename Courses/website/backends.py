@@ -0,0 +1,11 @@
+from django.contrib.auth.backends import ModelBackend
+
+from . import usercache
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend loading the request user from the shared cache"""
+
+    def get_user(self, user_id):
+        user = usercache.get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,194 @@
+"""Whole course export/import as NDJSON.
+
+An export is one JSON object per line: a "course" line, then its "unit"
+lines, then "lesson" and "quiz" lines pointing to their unit by `arrange`.
+Several courses can follow each other in one file. Exports are generated
+line by line from iterators, imports are bulk inserted in one transaction
+with Host/Tag/Skill/Language/Level resolved by name, the category by slug
+and the instructor by email. Imported courses are not approved.
+"""
+import json
+
+from django.db import IntegrityError, transaction
+
+from . import richtext, search
+from .models import (Category, Course, CourseStats, Host, Language, Lesson,
+                     Level, Quiz, Skill, Tag, Unit, User)
+
+FORMAT_VERSION = 1
+
+COURSE_FIELDS = ('slug', 'title', 'time', 'intro_text', 'intro_video',
+                 'before', 'after')
+UNIT_FIELDS = ('arrange', 'name', 'desc')
+LESSON_FIELDS = ('arrange', 'name', 'text', 'video')
+QUIZ_FIELDS = ('question', 'answer', 'ch1', 'ch2', 'ch3', 'ch4')
+
+
+class CoursePackError(ValueError):
+    pass
+
+
+def _line(item):
+    return json.dumps(item, ensure_ascii=False) + '\n'
+
+
+def export_course(course):
+    """NDJSON lines of `course` with its units, lessons and quizzes"""
+    item = {'type': 'course', 'version': FORMAT_VERSION}
+    item.update((f, getattr(course, f)) for f in COURSE_FIELDS)
+    item.update({
+        'instructor': course.instructor.email,
+        'category': course.category.slug,
+        'language': course.language.name if course.language else None,
+        'level': course.level.name if course.level else None,
+        'tags': [t.name for t in course.tags.all()],
+        'skills': [s.name for s in course.skills_covered.all()],
+    })
+    yield _line(item)
+
+    for values in (course.units.order_by('arrange')
+                   .values_list(*UNIT_FIELDS).iterator()):
+        yield _line(dict(zip(UNIT_FIELDS, values), type='unit'))
+    lessons = (Lesson.objects.filter(unit__course=course)
+               .order_by('unit__arrange', 'arrange')
+               .values_list('unit__arrange', 'host__name', *LESSON_FIELDS))
+    for unit, host, *values in lessons.iterator():
+        yield _line(dict(zip(LESSON_FIELDS, values), type='lesson',
+                         unit=unit, host=host))
+    quizzes = (Quiz.objects.filter(unit__course=course)
+               .order_by('unit__arrange', 'id')
+               .values_list('unit__arrange', *QUIZ_FIELDS))
+    for unit, *values in quizzes.iterator():
+        yield _line(dict(zip(QUIZ_FIELDS, values), type='quiz', unit=unit))
+
+
+def export_courses(courses):
+    for course in (courses.select_related('instructor', 'category',
+                                          'language', 'level')
+                   .prefetch_related('tags', 'skills_covered')):
+        yield from export_course(course)
+
+
+class Importer:
+    """Builds the courses of an export, one line at a time"""
+
+    def __init__(self, instructor=None, batch_size=1000):
+        self.instructor = instructor
+        self.batch_size = batch_size
+        self.courses = []
+        self.course = None
+        self.hosts = {}
+
+    def add(self, item):
+        kind = item.get('type')
+        if kind == 'course':
+            self.finish()
+            self.start(item)
+            return
+        if self.course is None:
+            raise CoursePackError('%s before any course' % kind)
+        if kind == 'unit':
+            if self.unit_ids is not None:
+                raise CoursePackError('units must come before lessons and quizzes')
+            unit = Unit(course=self.course, **{f: item[f] for f in UNIT_FIELDS})
+            richtext.render_fields(unit)
+            self.units.append(unit)
+        elif kind == 'lesson':
+            lesson = Lesson(
+                unit_id=self.unit_id(item['unit']), host=self.host(item['host']),
+                **{f: item[f] for f in LESSON_FIELDS})
+            lesson.render_video(lesson.host)
+            self.lessons.append(lesson)
+        elif kind == 'quiz':
+            self.quizzes.append(Quiz(
+                unit_id=self.unit_id(item['unit']),
+                **{f: item.get(f) for f in QUIZ_FIELDS}))
+        else:
+            raise CoursePackError('unknown line type %r' % kind)
+        self.flush()
+
+    def start(self, item):
+        if item.get('version') != FORMAT_VERSION:
+            raise CoursePackError('unsupported version %r' % item.get('version'))
+        if Course.objects.filter(slug=item['slug']).exists():
+            raise CoursePackError('course %s already exists' % item['slug'])
+        instructor = self.instructor
+        if instructor is None:
+            instructor = User.objects.filter(email=item['instructor']).first()
+            if instructor is None:
+                raise CoursePackError('unknown instructor %s' % item['instructor'])
+        category = Category.objects.filter(slug=item['category']).first()
+        if category is None:
+            raise CoursePackError('unknown category %s' % item['category'])
+        course = Course(instructor=instructor, category=category, **{
+            f: item[f] for f in COURSE_FIELDS})
+        if item.get('language'):
+            course.language = Language.objects.get_or_create(name=item['language'])[0]
+        if item.get('level'):
+            course.level = Level.objects.get_or_create(name=item['level'])[0]
+        course.save()
+        course.tags.set([Tag.objects.get_or_create(name=n, defaults={'desc': n})[0]
+                         for n in item.get('tags', [])])
+        course.skills_covered.set([Skill.objects.get_or_create(name=n)[0]
+                                   for n in item.get('skills', [])])
+        self.course = course
+        self.units, self.lessons, self.quizzes = [], [], []
+        self.unit_ids = None
+
+    def host(self, name):
+        if name not in self.hosts:
+            self.hosts[name] = Host.objects.filter(name=name).first()
+            if self.hosts[name] is None:
+                raise CoursePackError('unknown host %s' % name)
+        return self.hosts[name]
+
+    def unit_id(self, arrange):
+        if self.unit_ids is None:
+            Unit.objects.bulk_create(self.units, batch_size=self.batch_size)
+            # pks are not set by bulk_create on every backend
+            self.unit_ids = dict(Unit.objects.filter(
+                course=self.course).values_list('arrange', 'pk'))
+        try:
+            return self.unit_ids[arrange]
+        except KeyError:
+            raise CoursePackError('unknown unit %r' % arrange)
+
+    def flush(self, force=False):
+        for model, objs in ((Lesson, self.lessons), (Quiz, self.quizzes)):
+            if objs and (force or len(objs) >= self.batch_size):
+                model.objects.bulk_create(objs)
+                objs.clear()
+
+    def finish(self):
+        """Write what is left of the current course and its counters,
+        which the bulk inserts did not update"""
+        if self.course is None:
+            return
+        if self.unit_ids is None:
+            Unit.objects.bulk_create(self.units, batch_size=self.batch_size)
+        self.flush(force=True)
+        courses = Course.objects.filter(pk=self.course.pk)
+        CourseStats.rebuild(courses)
+        search.backend().index_courses(courses)
+        self.courses.append(self.course)
+        self.course = None
+
+
+def import_courses(lines, instructor=None, batch_size=1000):
+    """Create the courses of an export (iterable of lines) in one
+    transaction and return them. `instructor` overrides the file's one."""
+    importer = Importer(instructor, batch_size)
+    number = 0
+    try:
+        with transaction.atomic():
+            for number, line in enumerate(lines, 1):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8')
+                if line.strip():
+                    importer.add(json.loads(line))
+            importer.finish()
+    except CoursePackError as e:
+        raise CoursePackError('line %d: %s' % (number, e))
+    except (ValueError, KeyError, TypeError, IntegrityError) as e:
+        raise CoursePackError('line %d: invalid data (%s)' % (number, e))
+    return importer.courses
@@ -0,0 +1,118 @@
+"""Database routing and connection tuning.
+
+PrimaryReplicaRouter sends reads of the catalog models to the aliases in
+DATABASE_REPLICAS and everything else, and every write, to 'default'.
+Unsafe requests (POST...) read from 'default' from the start, and views
+that write on GET use the `use_primary` decorator. After a write the
+request keeps reading from 'default', and PrimaryPinMiddleware keeps that
+client on 'default' for REPLICA_PIN_SECONDS with a cookie, so users read
+their own writes while the replicas catch up.
+
+`sqlite_pragmas` applies SQLITE_PRAGMAS (WAL, busy timeout, mmap...) to
+every new SQLite connection, and `estimated_count` sizes a table without
+counting its rows.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+CATALOG_MODELS = {'category', 'course', 'coursestats', 'unit', 'lesson',
+                  'quiz', 'tag', 'skill', 'host', 'language', 'level'}
+
+PIN_COOKIE = 'pin_primary'
+
+_state = threading.local()
+
+
+def pin_primary():
+    _state.pinned = True
+    _state.wrote = True
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def use_primary(view):
+    """Run every query of `view` on 'default' (views writing on GET)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        _state.pinned = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if (not replicas or is_pinned()
+                or model._meta.app_label != 'website'
+                or model._meta.model_name not in CATALOG_MODELS
+                or connections['default'].in_atomic_block):
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class PrimaryPinMiddleware:
+    """Read from 'default' after this client wrote, see module docstring"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_until = request.COOKIES.get(PIN_COOKIE, '')
+        _state.pinned = (request.method not in ('GET', 'HEAD', 'OPTIONS') or
+                         pinned_until.isdigit() and int(pinned_until) > time.time())
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.pinned = _state.wrote = False
+        if wrote:
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True)
+        return response
+
+
+@receiver(connection_created)
+def sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+
+
+def estimated_count(model, using='default'):
+    """Approximate row count of `model`'s table: the planner statistics on
+    PostgreSQL, the highest primary key elsewhere (both index lookups)"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+    last = (model._default_manager.using(using).order_by('-pk')
+            .values_list('pk', flat=True).first())
+    return last if isinstance(last, int) else 0
@@ -0,0 +1,130 @@
+"""Serving protected files (Course.files) with Range and ETag support.
+
+They are stored by ProtectedStorage under PROTECTED_MEDIA_ROOT, which no
+URL maps to, so `file_response` behind an access check is the only way
+to download them.
+
+When DOWNLOADS_SENDFILE_HEADER is set ('X-Accel-Redirect' for nginx,
+'X-Sendfile' for Apache/lighttpd) the response only carries that header and
+the front server sends the file, handling Range itself. Otherwise the file
+is streamed by Django: whole files through FileResponse (sendfile via
+wsgi.file_wrapper when the server offers it) and byte ranges in chunks.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import (FileResponse, HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.functional import cached_property
+from django.utils.http import http_date, parse_etags, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class ProtectedStorage(FileSystemStorage):
+    """FileSystemStorage of PROTECTED_MEDIA_ROOT"""
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location,
+                                      settings.PROTECTED_MEDIA_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PROTECTED_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+def etag_matches(header, etag):
+    """Weak comparison of `etag` with an If-None-Match header"""
+    etags = parse_etags(header or '')
+    if etags == ['*']:
+        return True
+    weak = lambda tag: tag[2:] if tag.startswith('W/') else tag
+    return weak(etag) in {weak(tag) for tag in etags}
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range, None to send the
+    whole file, or False when the range cannot be satisfied"""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, fieldfile):
+    """Response sending `fieldfile` (a stored FileField value)"""
+    path = fieldfile.path
+    stat = os.stat(path)
+    etag = quote_etag('%x-%x' % (int(stat.st_mtime), stat.st_size))
+    filename = os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    header = getattr(settings, 'DOWNLOADS_SENDFILE_HEADER', None)
+    if header:
+        response = HttpResponse(content_type=content_type)
+        if header == 'X-Accel-Redirect':
+            response[header] = (getattr(settings, 'DOWNLOADS_ACCEL_PREFIX',
+                                        '/protected/') + fieldfile.name)
+        else:
+            response[header] = path
+    else:
+        byte_range = None
+        if request.META.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % stat.st_size
+            return response
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(path, start, end),
+                                             status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, end, stat.st_size)
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    response['Cache-Control'] = 'private, max-age=0'
+    return response
@@ -21,3 +21,7 @@ class UserForm(forms.ModelForm):
 
 class SearchForm(forms.Form):
     name = forms.CharField(max_length=255, label=_('Name'))
+
+
+class CourseImportForm(forms.Form):
+    file = forms.FileField(label=_('Course export (NDJSON)'))
@@ -0,0 +1,89 @@
+"""The hot views, as requests built from existing data, and the query
+plan checks run on them.
+
+Shared by the `benchmark` and `check_query_plans` commands and the
+QueryPlanTest of website/tests.py so all look at the same pages.
+"""
+import re
+
+from django.db import connection
+from django.urls import reverse
+from django.utils import translation
+
+from .models import Category, Lesson, Rel
+
+
+# tables small enough that a full scan is fine
+SMALL_TABLES = {'website_category', 'website_tag', 'website_skill',
+                'website_host', 'website_language', 'website_level',
+                'django_content_type', 'django_site'}
+
+# vendor -> (EXPLAIN prefix, regex finding the table of a full scan);
+# SQLite < 3.36 writes "SCAN TABLE x", and scanning a whole covering index
+# reads every row as well
+EXPLAIN = {
+    'sqlite': ('EXPLAIN QUERY PLAN ', re.compile(
+        r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?'
+        r'(?: USING (?:COVERING )?INDEX \w+)?$')),
+    'postgresql': ('EXPLAIN ', re.compile(r'Seq Scan on (\w+)')),
+}
+
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+
+class NoData(Exception):
+    pass
+
+
+def scenarios():
+    """([(name, method, url, needs_login)], student to log in with)"""
+    rel = (Rel.objects.filter(course__is_approved=True,
+                              course__units__lessons__isnull=False)
+           .select_related('course', 'student').first())
+    if rel is None:
+        raise NoData('No enrollment with lessons, run generate_catalog first')
+    course = rel.course
+    lesson = Lesson.objects.filter(unit__course=course).select_related(
+        'unit').first()
+    category = Category.objects.filter(
+        courses__is_approved=True).first()
+    word = course.title.split()[0]
+    with translation.override('en'):
+        return [
+            ('discover', 'get', reverse('discover'), False),
+            ('categoryCourses', 'get', reverse('category', args=[category.slug]), False),
+            ('courseView', 'get', reverse('course', args=[course.slug]), False),
+            ('unitView', 'get', reverse('unit', args=[course.slug, lesson.unit_id]), True),
+            ('LessonView', 'get', reverse('lesson', args=[
+                course.slug, lesson.unit_id, lesson.pk]), True),
+            ('attend', 'post', reverse('attend_url', args=[lesson.pk]), True),
+            ('myCourses', 'get', reverse('myCourses'), True),
+            ('search', 'get', reverse('search') + '?name=' + word, False),
+        ], rel.student
+
+
+def explainable(captured):
+    """SQL of the queries of a CaptureQueriesContext that EXPLAIN accepts"""
+    return [q['sql'] for q in captured.captured_queries
+            if q['sql'].lstrip().upper().startswith(EXPLAINABLE)]
+
+
+def explain(sql):
+    """Lines of the query plan of `sql`"""
+    prefix, _ = EXPLAIN[connection.vendor]
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(lines, allowed=SMALL_TABLES):
+    """Tables a query plan reads in full, except the `allowed` ones"""
+    _, pattern = EXPLAIN[connection.vendor]
+    tables = set(connection.introspection.table_names())
+    scans = set()
+    for line in lines:
+        match = pattern.search(line.strip())
+        # CTEs and subqueries show up as "SCAN <name>" too
+        if match and match.group(1) in tables - allowed:
+            scans.add(match.group(1))
+    return scans
@@ -0,0 +1,91 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from website import hotpaths
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Time the main views against the current database and report '
+            'latency percentiles and query counts, optionally against a '
+            'saved baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--requests', type=int, default=50,
+                            help='Requests per view')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--views', nargs='*',
+                            help='Only run these views')
+        parser.add_argument('--save', metavar='FILE',
+                            help='Write the results as a baseline')
+        parser.add_argument('--compare', metavar='FILE',
+                            help='Compare with a saved baseline')
+
+    def run(self, method, url, login, count, warmup):
+        client = Client(HTTP_HOST='localhost')
+        request = getattr(client, method)
+        if login:
+            client.force_login(self.student)
+        for _ in range(warmup):
+            request(url)
+        timings, queries = [], []
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured.captured_queries))
+            if response.status_code >= 400:
+                raise CommandError('%s answered %d' % (url, response.status_code))
+        return {
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'queries': max(queries),
+        }
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        try:
+            scenarios, self.student = hotpaths.scenarios()
+        except hotpaths.NoData as e:
+            raise CommandError(e)
+
+        results = {}
+        self.stdout.write('%-16s %9s %9s %9s %8s' % (
+            'view', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for name, method, url, login in scenarios:
+            if options['views'] and name not in options['views']:
+                continue
+            result = self.run(method, url, login, options['requests'],
+                              options['warmup'])
+            results[name] = result
+            line = '%-16s %9.2f %9.2f %9.2f %8d' % (
+                name, result['p50'], result['p95'], result['p99'],
+                result['queries'])
+            if name in baseline:
+                old = baseline[name]
+                change = ((result['p50'] - old['p50']) / old['p50'] * 100
+                          if old['p50'] else 0)
+                line += '   p50 %+.0f%%, queries %+d' % (
+                    change, result['queries'] - old['queries'])
+            self.stdout.write(line)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS('Saved %s' % options['save']))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from website.models import Upload
+from website.responsive import process
+
+
+class Command(BaseCommand):
+    help = ('Build the resized variants of the uploaded images and render '
+            'the rich text linking to them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Rebuild uploads that already have variants')
+
+    def handle(self, *args, **options):
+        uploads = Upload.objects.all()
+        if not options['all']:
+            uploads = uploads.filter(variants__isnull=True)
+        done = 0
+        for digest in uploads.values_list('digest', flat=True).iterator():
+            process(digest, force=True)
+            done += 1
+        self.stdout.write(self.style.SUCCESS('Processed %d uploads' % done))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from website.models import User
+from website.thumbnails import process
+
+
+class Command(BaseCommand):
+    help = 'Build the resized variants of every User.pic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Rebuild users that already have variants')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(pic='').exclude(pic__isnull=True)
+        if not options['all']:
+            users = users.filter(pic_thumbs=False)
+        done = 0
+        for pk, name in users.values_list('pk', 'pic').iterator():
+            try:
+                process(pk, name)
+            except (OSError, ValueError) as e:
+                self.stderr.write('%s: %s' % (name, e))
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS('Built thumbnails for %d users'
+                                             % done))
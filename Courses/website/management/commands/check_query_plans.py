@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from website import hotpaths
+
+
+class Command(BaseCommand):
+    help = ('Request the hot views, EXPLAIN every query they run and fail '
+            'when one scans a whole large table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', nargs='*',
+                            help='Only check these views')
+        parser.add_argument('--allow', nargs='*', default=[], metavar='TABLE',
+                            help='More tables that may be fully scanned')
+        parser.add_argument('--show', action='store_true',
+                            help='Print the plan of every query')
+
+    def full_scans(self, sql):
+        lines = hotpaths.explain(sql)
+        if self.show:
+            self.stdout.write(sql)
+            for line in lines:
+                self.stdout.write('    ' + line)
+        return hotpaths.full_scans(lines, self.allowed)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in hotpaths.EXPLAIN:
+            raise CommandError('No plan check for %s' % connection.vendor)
+        self.show = options['show']
+        self.allowed = hotpaths.SMALL_TABLES | set(options['allow'])
+        try:
+            scenarios, student = hotpaths.scenarios()
+        except hotpaths.NoData as e:
+            raise CommandError(e)
+
+        failures = []
+        for name, method, url, login in scenarios:
+            if options['views'] and name not in options['views']:
+                continue
+            client = Client(HTTP_HOST='localhost')
+            if login:
+                client.force_login(student)
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(client, method)(url)
+            if response.status_code >= 400:
+                raise CommandError('%s answered %d' % (url, response.status_code))
+            queries = hotpaths.explainable(captured)
+            bad = []
+            for sql in queries:
+                scans = self.full_scans(sql)
+                if scans:
+                    bad.append((sql, scans))
+            self.stdout.write('%-16s %3d queries, %d with full scans' % (
+                name, len(queries), len(bad)))
+            for sql, scans in bad:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    '    scans %s: %s' % (', '.join(sorted(scans)), sql)))
+
+        if failures:
+            raise CommandError('Full table scans in %s' % ', '.join(
+                sorted(set(failures))))
+        self.stdout.write(self.style.SUCCESS('No full scans'))
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website import coursepack
+from website.models import Course
+
+
+class Command(BaseCommand):
+    help = ('Export courses with their units, lessons and quizzes as NDJSON '
+            '(see website/coursepack.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='+')
+        parser.add_argument('-o', '--output', metavar='FILE',
+                            help='Write to FILE instead of stdout')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.filter(slug__in=options['slugs'])
+        missing = set(options['slugs']) - set(courses.values_list('slug', flat=True))
+        if missing:
+            raise CommandError('Unknown courses: %s' % ', '.join(sorted(missing)))
+        out = (open(options['output'], 'w', encoding='utf-8')
+               if options['output'] else sys.stdout)
+        try:
+            out.writelines(coursepack.export_courses(courses))
+        finally:
+            if out is not sys.stdout:
+                out.close()
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from ckeditor_uploader.utils import storage
+
+from website.models import Upload, UploadLink
+from website.uploads import delete_blob, recount, scan_links
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the links to the CKEditor uploads from the rich text '
+            'and delete the uploads nothing links to')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Keep uploads younger than this many hours '
+                                 '(they may be in a form not saved yet)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        found = scan_links()
+        stored = {(digest, content_type, pk): link_pk
+                  for link_pk, digest, content_type, pk in
+                  UploadLink.objects.values_list(
+                      'pk', 'upload', 'content_type', 'object_id').iterator()}
+        missing = found - set(stored)
+        extra = [stored[key] for key in set(stored) - found]
+        if not options['dry_run']:
+            UploadLink.objects.filter(pk__in=extra).delete()
+            UploadLink.objects.bulk_create([
+                UploadLink(upload_id=digest, content_type_id=content_type,
+                           object_id=pk)
+                for digest, content_type, pk in missing],
+                ignore_conflicts=True)
+            recount()
+        linked = {digest for digest, content_type, pk in found}
+
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        unused = [(digest, name, size) for digest, name, size in
+                  Upload.objects.filter(uploaded__lt=cutoff)
+                  .values_list('digest', 'name', 'size').iterator()
+                  if digest not in linked]
+        freed = 0
+        for digest, name, size in unused:
+            freed += size
+            if options['dry_run']:
+                self.stdout.write(name)
+                continue
+            # skip blobs uploaded again or linked meanwhile
+            if Upload.objects.filter(digest=digest, refs=0,
+                                     uploaded__lt=cutoff).delete()[0]:
+                delete_blob(storage, digest, name)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            '%s %d uploads (%d bytes), fixed %d links'
+            % (verb, len(unused), freed, len(missing) + len(extra))))
@@ -0,0 +1,170 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from website import richtext, search
+from website.models import (Category, Course, CourseStats, Host, Language,
+                            Lesson, Level, Quiz, Rel, Skill, Tag, Unit, User)
+
+WORDS = ('python django web data machine learning design network security '
+         'cloud linux database mobile android testing devops algorithms '
+         'javascript react api rest graph game audio video marketing').split()
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic catalog (categories, '
+            'instructors, courses with units/lessons/quizzes, students with '
+            'enrollments and attendance) using bulk inserts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--instructors', type=int, default=50)
+        parser.add_argument('--courses', type=int, default=1000)
+        parser.add_argument('--units', type=int, default=8,
+                            help='Units per course')
+        parser.add_argument('--lessons', type=int, default=6,
+                            help='Lessons per unit')
+        parser.add_argument('--quizzes', type=int, default=2,
+                            help='Quizzes per unit')
+        parser.add_argument('--students', type=int, default=10000)
+        parser.add_argument('--enrollments', type=int, default=5,
+                            help='Courses per student')
+        parser.add_argument('--attendance', type=float, default=0.5,
+                            help='Share of lessons attended per enrollment')
+        parser.add_argument('--prefix', default='gen',
+                            help='Prefix of generated slugs and emails')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def log(self, msg):
+        if self.verbosity:
+            self.stdout.write(msg)
+
+    def bulk(self, model, objs, **kwargs):
+        # bulk_create skips the pre_save rendering of website/signals.py
+        rich_text = getattr(model, 'RICH_TEXT_FIELDS', None)
+        for batch in chunked(objs, self.batch_size):
+            for obj in batch:
+                if rich_text:
+                    richtext.render_fields(obj)
+                if model is Lesson:
+                    obj.render_video(obj.host)
+            model.objects.bulk_create(batch, **kwargs)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        now = timezone.now()
+        password = make_password('password')
+
+        host, _ = Host.objects.get_or_create(
+            name='YouTube', defaults={'website': 'https://www.youtube.com',
+                                      'before': '<iframe src="', 'after': '"></iframe>'})
+        languages = [Language.objects.get_or_create(name=n)[0] for n in ('EN', 'AR')]
+        levels = [Level.objects.get_or_create(name=n)[0]
+                  for n in ('Beginner', 'Intermediate', 'Advanced')]
+        tags = [Tag.objects.get_or_create(name=w, defaults={'desc': w})[0] for w in WORDS]
+        skills = [Skill.objects.get_or_create(name=w.title())[0] for w in WORDS]
+
+        self.bulk(Category, [
+            Category(name='%s category %d' % (prefix, i),
+                     slug='%s-category-%d' % (prefix, i),
+                     desc='<p>%s</p>' % ' '.join(rnd.sample(WORDS, 8)))
+            for i in range(options['categories'])])
+        categories = list(Category.objects.filter(slug__startswith=prefix + '-category-'))
+
+        self.bulk(User, [
+            User(email='%s-instructor-%d@example.com' % (prefix, i),
+                 first_name='Instructor', last_name=str(i), password=password,
+                 is_instructor=True)
+            for i in range(options['instructors'])])
+        instructors = list(User.objects.filter(
+            email__startswith=prefix + '-instructor-').values_list('pk', flat=True))
+        self.log('%d categories, %d instructors' % (len(categories), len(instructors)))
+
+        self.bulk(Course, [
+            Course(slug='%s-course-%d' % (prefix, i),
+                   title=' '.join(rnd.sample(WORDS, 3)).title(),
+                   instructor_id=rnd.choice(instructors),
+                   category=rnd.choice(categories), time=rnd.randint(1, 60),
+                   pub_date=now - timezone.timedelta(days=rnd.randint(0, 1000)),
+                   is_approved=rnd.random() < 0.9,
+                   intro_text='<p>%s</p>' % ' '.join(rnd.choices(WORDS, k=60)),
+                   intro_video='https://www.youtube.com/embed/x',
+                   before=' '.join(rnd.choices(WORDS, k=10)),
+                   after=' '.join(rnd.choices(WORDS, k=10)),
+                   language=rnd.choice(languages), level=rnd.choice(levels))
+            for i in range(options['courses'])])
+        generated = Course.objects.filter(slug__startswith=prefix + '-course-')
+        courses = list(generated.values_list('pk', flat=True))
+
+        self.bulk(Course.tags.through, [
+            Course.tags.through(course_id=c, tag_id=t.pk)
+            for c in courses for t in rnd.sample(tags, 3)])
+        self.bulk(Course.skills_covered.through, [
+            Course.skills_covered.through(course_id=c, skill_id=s.pk)
+            for c in courses for s in rnd.sample(skills, 3)])
+
+        self.bulk(Unit, [
+            Unit(name='Unit %d' % u, course_id=c, desc='<p>unit</p>', arrange=u)
+            for c in courses for u in range(1, options['units'] + 1)])
+        units = list(Unit.objects.filter(course__in=generated).values_list('pk', 'course'))
+        self.bulk(Lesson, [
+            Lesson(name='Lesson %d' % l, text=' '.join(rnd.choices(WORDS, k=40)),
+                   video='https://www.youtube.com/embed/x', arrange=l,
+                   unit_id=u, host=host)
+            for u, _ in units for l in range(1, options['lessons'] + 1)])
+        self.bulk(Quiz, [
+            Quiz(unit_id=u, question='Question %d ?' % q, answer='right',
+                 ch1='wrong', ch2='nope')
+            for u, _ in units for q in range(options['quizzes'])])
+        self.log('%d courses, %d units' % (len(courses), len(units)))
+
+        course_lessons = {}
+        for pk, course in Lesson.objects.filter(
+                unit__course__in=generated).values_list('pk', 'unit__course'):
+            course_lessons.setdefault(course, []).append(pk)
+
+        self.bulk(User, [
+            User(email='%s-student-%d@example.com' % (prefix, i),
+                 first_name='Student', last_name=str(i), password=password)
+            for i in range(options['students'])])
+        students = list(User.objects.filter(
+            email__startswith=prefix + '-student-').values_list('pk', flat=True))
+
+        per_student = min(options['enrollments'], len(courses))
+        self.bulk(Rel, [
+            Rel(student_id=s, course_id=c,
+                rel_type=Rel.FINISHED if rnd.random() < 0.2 else Rel.ENROLLMENT,
+                rating=rnd.randint(0, 10) if rnd.random() < 0.3 else None)
+            for s in students for c in rnd.sample(courses, per_student)],
+            ignore_conflicts=True)
+
+        through = Rel.lessons_attended.through
+        links = []
+        rels = Rel.objects.filter(
+            student__email__startswith=prefix + '-student-').values_list('pk', 'course')
+        for rel, course in rels.iterator():
+            lessons = course_lessons.get(course, [])
+            for lesson in rnd.sample(lessons, int(len(lessons) * options['attendance'])):
+                links.append(through(rel_id=rel, lesson_id=lesson))
+            if len(links) >= self.batch_size:
+                through.objects.bulk_create(links, ignore_conflicts=True)
+                links = []
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        self.log('%d students' % len(students))
+
+        CourseStats.rebuild(generated)
+        search.backend().index_courses(generated)
+        self.stdout.write(self.style.SUCCESS('Catalog generated'))
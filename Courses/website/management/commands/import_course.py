@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website import coursepack
+from website.models import User
+
+
+class Command(BaseCommand):
+    help = ('Import courses exported by export_course, in one transaction. '
+            'Imported courses wait for approval.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="NDJSON export, '-' for stdin")
+        parser.add_argument('--instructor', metavar='EMAIL',
+                            help="Instructor of the imported courses instead "
+                                 "of the file's one")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        instructor = None
+        if options['instructor']:
+            instructor = User.objects.filter(email=options['instructor']).first()
+            if instructor is None:
+                raise CommandError('Unknown user %s' % options['instructor'])
+        f = (open(options['file'], encoding='utf-8')
+             if options['file'] != '-' else sys.stdin)
+        try:
+            courses = coursepack.import_courses(f, instructor,
+                                                options['batch_size'])
+        except coursepack.CoursePackError as e:
+            raise CommandError(e)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        for course in courses:
+            self.stdout.write('Imported %s' % course.slug)
+        self.stdout.write(self.style.SUCCESS('%d courses imported' % len(courses)))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from website.models import Course, CourseStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized CourseStats counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*',
+                            help='Only rebuild these courses (default: all)')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['slugs']:
+            courses = courses.filter(slug__in=options['slugs'])
+        CourseStats.rebuild(courses)
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt stats for %d courses' % courses.count()))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from website import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the course full-text search index'
+
+    def handle(self, *args, **options):
+        search.backend().rebuild()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from website.models import NewsTeller_Emails
+from website.newsletter import queued_messages, send_newsletter
+
+
+class Command(BaseCommand):
+    help = ('Send a NewsTeller email, or every email queued from the admin, '
+            'to each subscriber who did not get it yet (safe to rerun after '
+            'a crash)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('message_id', type=int, nargs='?',
+                            help='Default: the queued emails')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Max messages per second, 0 for no limit')
+        parser.add_argument('--backend', default=None,
+                            help='Email backend path, default EMAIL_BACKEND')
+
+    def handle(self, *args, **options):
+        if options['message_id'] is None:
+            messages = queued_messages()
+        else:
+            messages = NewsTeller_Emails.objects.filter(pk=options['message_id'])
+            if not messages:
+                raise CommandError(
+                    'No NewsTeller email %s' % options['message_id'])
+        for message in messages:
+            self.send(message, options)
+
+    def send(self, message, options):
+        def progress(report):
+            if options['verbosity'] > 1:
+                self.stdout.write('sent %(sent)d failed %(failed)d' % report)
+
+        report = send_newsletter(message, workers=options['workers'],
+                                 batch_size=options['batch_size'],
+                                 rate=options['rate'],
+                                 backend=options['backend'],
+                                 progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            '%(subject)s: sent %(sent)d, failed %(failed)d in %(seconds)ss '
+            '(%(per_second)s/s)' % dict(report, subject=message.subject)))
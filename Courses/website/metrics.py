@@ -0,0 +1,203 @@
+"""Per-view request metrics in Prometheus text format.
+
+MetricsMiddleware records, for every URL name: a latency histogram, the
+number and time of DB queries, template render time and response bytes.
+Numbers are kept in process memory. When METRICS_DIR is set, each process
+also dumps its totals to `<METRICS_DIR>/<pid>.json` every
+METRICS_FLUSH_INTERVAL seconds, and the `metrics` view adds up every file
+so one scrape covers all workers.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends import django as django_backend
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTERS = ('count', 'seconds', 'queries', 'db_seconds', 'template_seconds',
+            'bytes')
+
+
+def new_series():
+    series = dict.fromkeys(COUNTERS, 0)
+    series['buckets'] = [0] * len(BUCKETS)
+    return series
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = defaultdict(new_series)
+        self.flushed_at = time.monotonic()
+
+    def observe(self, view, seconds, queries, db_seconds, template_seconds,
+                size):
+        with self.lock:
+            series = self.series[view]
+            series['count'] += 1
+            series['seconds'] += seconds
+            series['queries'] += queries
+            series['db_seconds'] += db_seconds
+            series['template_seconds'] += template_seconds
+            series['bytes'] += size
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+                    break
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.series))
+
+    def maybe_flush(self, force=False):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        if not directory or (not force and
+                             time.monotonic() - self.flushed_at < interval):
+            return
+        self.flushed_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+
+registry = Registry()
+_local = threading.local()
+
+
+def _instrument_templates():
+    """Time the top level render of every Django template"""
+    render = django_backend.Template.render
+    if getattr(render, 'metrics', False):
+        return
+
+    def timed_render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            if getattr(_local, 'active', False):
+                _local.template_seconds += time.perf_counter() - started
+    timed_render.metrics = True
+    django_backend.Template.render = timed_render
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _instrument_templates()
+
+    def count_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _local.queries += 1
+            _local.db_seconds += time.perf_counter() - started
+
+    def __call__(self, request):
+        _local.active = True
+        _local.queries = _local.db_seconds = _local.template_seconds = 0
+        started = time.perf_counter()
+        wrappers = [c.execute_wrapper(self.count_query) for c in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+            _local.active = False
+        seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        registry.observe(view, seconds, _local.queries, _local.db_seconds,
+                         _local.template_seconds, size)
+        return response
+
+
+def collect():
+    """Totals of every process (this one included)"""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return registry.snapshot()
+    registry.maybe_flush(force=True)
+    total = defaultdict(new_series)
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for view, series in data.items():
+            into = total[view]
+            for key in COUNTERS:
+                into[key] += series[key]
+            into['buckets'] = [a + b for a, b in
+                               zip(into['buckets'], series['buckets'])]
+    return total
+
+
+def render_prometheus(data):
+    lines = []
+
+    def metric(name, kind, help_text):
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, kind))
+
+    def label(view):
+        return view.replace('\\', '\\\\').replace('"', '\\"')
+
+    name = 'django_view_request_duration_seconds'
+    metric(name, 'histogram', 'Request latency by URL name.')
+    for view, series in sorted(data.items()):
+        cumulative = 0
+        for bound, n in zip(BUCKETS, series['buckets']):
+            cumulative += n
+            lines.append('%s_bucket{view="%s",le="%s"} %d' % (
+                name, label(view), bound, cumulative))
+        lines.append('%s_bucket{view="%s",le="+Inf"} %d' % (
+            name, label(view), series['count']))
+        lines.append('%s_sum{view="%s"} %f' % (name, label(view), series['seconds']))
+        lines.append('%s_count{view="%s"} %d' % (name, label(view), series['count']))
+
+    for key, name, help_text in (
+            ('queries', 'django_view_db_queries_total', 'DB queries run.'),
+            ('db_seconds', 'django_view_db_seconds_total', 'Time spent in DB queries.'),
+            ('template_seconds', 'django_view_template_seconds_total',
+             'Time spent rendering templates.'),
+            ('bytes', 'django_view_response_bytes_total', 'Response body bytes.')):
+        metric(name, 'counter', help_text)
+        for view, series in sorted(data.items()):
+            lines.append('%s{view="%s"} %s' % (name, label(view), series[key]))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    """Prometheus endpoint, for staff or `Authorization: Bearer METRICS_TOKEN`"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorized = (token and request.META.get('HTTP_AUTHORIZATION') ==
+                  'Bearer %s' % token) or request.user.is_staff
+    if not authorized:
+        raise PermissionDenied
+    return HttpResponse(render_prometheus(collect()),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,62 @@
+# Generated by Django 3.0.14 on 2026-10-18 16:42
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+ENROLLMENT, FINISHED = 1, 2
+
+
+def grouped(queryset, course, **aggregates):
+    """{course id: {name: value}} of `aggregates` grouped by `course`"""
+    return {row.pop(course): row for row in
+            queryset.values(course).order_by().annotate(**aggregates)}
+
+
+def build_stats(apps, schema_editor):
+    Course = apps.get_model('website', 'Course')
+    CourseStats = apps.get_model('website', 'CourseStats')
+    Unit = apps.get_model('website', 'Unit')
+    Lesson = apps.get_model('website', 'Lesson')
+    Rel = apps.get_model('website', 'Rel')
+    units = grouped(Unit.objects, 'course', units=Count('pk'))
+    lessons = grouped(Lesson.objects, 'unit__course', lessons=Count('pk'))
+    rels = grouped(
+        Rel.objects, 'course',
+        enrollments=Count('pk', filter=Q(rel_type=ENROLLMENT)),
+        finished=Count('pk', filter=Q(rel_type=FINISHED)),
+        rating_sum=Sum('rating'), rating_count=Count('rating'))
+    stats = []
+    for pk in Course.objects.values_list('pk', flat=True).iterator():
+        counters = dict(units.get(pk, {}), **lessons.get(pk, {}),
+                        **rels.get(pk, {}))
+        stats.append(CourseStats(course_id=pk, **{
+            name: value or 0 for name, value in counters.items()}))
+    CourseStats.objects.bulk_create(stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0002_auto_20200514_0349'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='website.Course')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Units')),
+                ('lessons', models.PositiveIntegerField(default=0, verbose_name='Lessons')),
+                ('enrollments', models.PositiveIntegerField(default=0, verbose_name='Active enrollments')),
+                ('finished', models.PositiveIntegerField(default=0, verbose_name='Finished')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Rating sum')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='Rating count')),
+            ],
+            options={
+                'verbose_name': 'Course Stats',
+                'verbose_name_plural': 'Course Stats',
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
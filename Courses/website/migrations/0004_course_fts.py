@@ -0,0 +1,26 @@
+from django.db import migrations
+
+FTS_SQL = ("CREATE VIRTUAL TABLE IF NOT EXISTS website_course_fts USING fts5("
+           "title, intro_text, before, after, tags, skills, instructor, "
+           "tokenize = 'unicode61 remove_diacritics 2')")
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(FTS_SQL)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS website_course_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0003_coursestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.14 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0004_course_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursestats',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1, verbose_name='Content version'),
+        ),
+        migrations.AddField(
+            model_name='rel',
+            name='lessons_bits',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='rel',
+            name='progress_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rel',
+            name='quizzes_bits',
+            field=models.BinaryField(default=b''),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-18 16:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0005_rel_progress_bits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsTellerDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.IntegerField(choices=[(1, 'Sent'), (2, 'Failed')])),
+                ('date', models.DateTimeField(auto_now=True, verbose_name='Date')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='website.NewsTeller_Emails')),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='website.NewsTeller')),
+            ],
+            options={
+                'verbose_name': 'NewsTeller Delivery',
+                'verbose_name_plural': 'NewsTeller Deliveries',
+                'unique_together': {('message', 'subscriber')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0006_newstellerdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='pic_thumbs',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.14 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_user_pic_thumbs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_approved', 'category', 'pub_date'], name='website_cou_is_appr_39ed49_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_approved', 'slug'], name='website_cou_is_appr_eba573_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['unit', 'arrange'], name='website_les_unit_id_391652_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rel',
+            index=models.Index(fields=['student', 'rel_type'], name='website_rel_student_38498c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='unit',
+            index=models.Index(fields=['course', 'arrange'], name='website_uni_course__812a01_idx'),
+        ),
+    ]
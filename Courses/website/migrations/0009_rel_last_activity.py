@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rel',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last activity'),
+        ),
+    ]
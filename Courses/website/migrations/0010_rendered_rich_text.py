@@ -0,0 +1,115 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+from website import richtext
+
+RICH_TEXT_FIELDS = (('Category', 'desc'), ('Course', 'intro_text'),
+                    ('Unit', 'desc'), ('User', 'about'))
+BATCH = 500
+
+
+def batches(queryset):
+    batch = []
+    for obj in queryset.iterator():
+        batch.append(obj)
+        if len(batch) == BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_existing(apps, schema_editor):
+    for model_name, field in RICH_TEXT_FIELDS:
+        model = apps.get_model('website', model_name)
+        columns = [field + '_html', field + '_plain', field + '_summary']
+        for batch in batches(model.objects.only('pk', field)):
+            for obj in batch:
+                richtext.render_fields(obj, [field])
+            model.objects.bulk_update(batch, columns)
+
+    Host = apps.get_model('website', 'Host')
+    Lesson = apps.get_model('website', 'Lesson')
+    hosts = {h.pk: h for h in Host.objects.all()}
+    for batch in batches(Lesson.objects.only('pk', 'video', 'host')):
+        for lesson in batch:
+            host = hosts[lesson.host_id]
+            lesson.video_html = richtext.embed(host.before, lesson.video, host.after)
+        Lesson.objects.bulk_update(batch, ['video_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0009_rel_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='desc_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='desc_plain',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='desc_summary',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='intro_text_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='intro_text_plain',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='intro_text_summary',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='unit',
+            name='desc_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='unit',
+            name='desc_plain',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='unit',
+            name='desc_summary',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='about_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='about_plain',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='about_summary',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
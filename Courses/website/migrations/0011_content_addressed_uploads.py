@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0010_rendered_rich_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('name', models.CharField(max_length=255, verbose_name='Path')),
+                ('size', models.PositiveIntegerField(verbose_name='Size')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='References')),
+                ('uploaded', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Last uploaded')),
+            ],
+            options={
+                'verbose_name': 'Upload',
+                'verbose_name_plural': 'Uploads',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(fields=['refs', 'uploaded'], name='website_upl_refs_c5465e_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0011_content_addressed_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Height'),
+        ),
+        migrations.AddField(
+            model_name='upload',
+            name='variants',
+            field=models.CharField(blank=True, help_text='Comma separated, unset until the image is processed', max_length=100, null=True, verbose_name='Variant widths'),
+        ),
+        migrations.AddField(
+            model_name='upload',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Width'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:29
+
+import os
+import shutil
+
+from django.conf import settings
+from django.db import migrations, models
+import website.downloads
+
+
+def move_files(apps, schema_editor):
+    """Move the existing course files from MEDIA_ROOT to the new storage"""
+    Course = apps.get_model('website', 'Course')
+    target = website.downloads.ProtectedStorage()
+    for name in Course.objects.exclude(files='').exclude(
+            files__isnull=True).values_list('files', flat=True).iterator():
+        source = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.isfile(source) and not target.exists(name):
+            os.makedirs(os.path.dirname(target.path(name)), exist_ok=True)
+            shutil.move(source, target.path(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0012_upload_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='files',
+            field=models.FileField(blank=True, null=True, storage=website.downloads.ProtectedStorage(), upload_to='CF', verbose_name='Attached Files in Zip and named\n                               as course title'),
+        ),
+        migrations.RunPython(move_files, migrations.RunPython.noop),
+    ]
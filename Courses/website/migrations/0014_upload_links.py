@@ -0,0 +1,61 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from website import uploads
+
+RICH_TEXT_FIELDS = (('Category', 'desc'), ('Course', 'intro_text'),
+                    ('Unit', 'desc'), ('User', 'about'))
+
+
+def link_existing(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Upload = apps.get_model('website', 'Upload')
+    UploadLink = apps.get_model('website', 'UploadLink')
+    known = set(Upload.objects.values_list('digest', flat=True))
+    links = []
+    for model_name, field in RICH_TEXT_FIELDS:
+        model = apps.get_model('website', model_name)
+        content_type = ContentType.objects.get_for_model(model)
+        for pk, html in model.objects.values_list('pk', field).iterator():
+            links += [UploadLink(upload_id=digest, content_type=content_type,
+                                 object_id=pk)
+                      for digest in uploads.referenced(html) & known]
+    UploadLink.objects.bulk_create(links, batch_size=500)
+    for upload in Upload.objects.all():
+        upload.refs = UploadLink.objects.filter(upload=upload).count()
+        upload.save(update_fields=['refs'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('website', '0013_protected_course_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadLink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='links', to='website.Upload')),
+            ],
+            options={
+                'verbose_name': 'Upload link',
+                'verbose_name_plural': 'Upload links',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uploadlink',
+            index=models.Index(fields=['content_type', 'object_id'], name='website_upl_content_97a845_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploadlink',
+            unique_together={('upload', 'content_type', 'object_id')},
+        ),
+        migrations.RunPython(link_existing, migrations.RunPython.noop),
+    ]
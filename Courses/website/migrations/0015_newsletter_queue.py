@@ -0,0 +1,22 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0014_upload_links'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newstellerdelivery',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Pending'), (1, 'Sent'), (2, 'Failed')]),
+        ),
+        migrations.AddIndex(
+            model_name='newstellerdelivery',
+            index=models.Index(fields=['status', 'message'], name='website_new_status_695107_idx'),
+        ),
+    ]
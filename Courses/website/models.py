@@ -3,15 +3,21 @@ import uuid
 
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin)
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 from django.utils.html import format_html
 from ckeditor_uploader.fields import RichTextUploadingField
 
+from .downloads import ProtectedStorage
+from .richtext import embed
+
 # --- HELPER FUNCTIONS ---
 
 
@@ -30,7 +36,19 @@ def uuid_path(instance, file_name):
 # --- User Model ---
 
 
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        """Update the rows and drop their copies cached by
+        website/usercache.py, which only sees User saves"""
+        from . import usercache
+        pks = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        usercache.invalidate_users(pks)
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
 
     def create_user(self, email, password=None, **extra_fields):
         """Creates and saves a new User"""
@@ -62,6 +80,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(_('Is Staff ?'), default=False)
     is_instructor = models.BooleanField(_('Is Instructor ?'), default=False)
     about = RichTextUploadingField(_('Description'), null=True, blank=True)
+    # rendered from about on save, see website/richtext.py
+    about_html = models.TextField(default='', editable=False)
+    about_plain = models.TextField(default='', editable=False)
+    about_summary = models.CharField(max_length=255, default='',
+                                     editable=False)
     phone = models.CharField(_('Phone'), max_length=20, blank=True, null=True)
     is_male = models.BooleanField(_('Gender'), default=True,
                                   choices=((True, _('Male')), (False, _('Female'))))
@@ -71,14 +94,18 @@ class User(AbstractBaseUser, PermissionsMixin):
     city = models.CharField(_('City'), max_length=30, blank=True, null=True)
     pic = models.ImageField(_('Personal Pic'), upload_to=uuid_path,
                             null=True, blank=True)
+    pic_thumbs = models.BooleanField(default=False, editable=False)
     courses = models.ManyToManyField(
         'Course', through='Rel', related_name='students')
 
     objects = UserManager()
     USERNAME_FIELD = 'email'
+    RICH_TEXT_FIELDS = ('about',)
 
     def pic_tag(self):
-        return format_html('<img src="{}" width="450px" />'.format(self.pic.url))
+        from .thumbnails import variant_url
+        return format_html('<img src="{}" width="450px" />',
+                           variant_url(self, 'large'))
     pic_tag.short_description = _('Image')
     pic_tag.allow_tags = True
 
@@ -141,7 +168,14 @@ class Category(models.Model):
     name = models.CharField(_('Category name'), max_length=100, unique=True)
     slug = models.SlugField(_('slug in url'), unique=True)
     desc = RichTextUploadingField(_('Description'))
-    
+    # rendered from desc on save, see website/richtext.py
+    desc_html = models.TextField(default='', editable=False)
+    desc_plain = models.TextField(default='', editable=False)
+    desc_summary = models.CharField(max_length=255, default='',
+                                    editable=False)
+
+    RICH_TEXT_FIELDS = ('desc',)
+
     def get_5_courses(self):
         return self.courses.filter(is_approved=True)[:5]
     
@@ -169,6 +203,45 @@ class Tag(models.Model):
         verbose_name_plural = _('Tags')
 
 
+class CourseManager(models.Manager):
+
+    def approved(self):
+        return self.filter(is_approved=True)
+
+    def top_per_category(self, n=5):
+        """Approved courses limited to the first `n` (by pub_date) of every
+        category, fetched with the category in one query"""
+        first_n = self.approved().filter(
+            category=OuterRef('category')).order_by('pub_date').values('pk')[:n]
+        return (self.approved()
+                .filter(pk__in=Subquery(first_n))
+                .defer(*COURSE_BODY_FIELDS)
+                .select_related('category')
+                .order_by('category_id', 'pub_date'))
+
+    def discover(self, n=5, min_courses=3):
+        """Group `top_per_category` into one list per category,
+        skipping categories with less than `min_courses` courses"""
+        groups = []
+        for course in self.top_per_category(n):
+            if groups and groups[-1][0].category_id == course.category_id:
+                groups[-1].append(course)
+            else:
+                groups.append([course])
+        return [g for g in groups if len(g) >= min_courses]
+
+
+# long Course columns that listings do not show
+COURSE_BODY_FIELDS = ('intro_text', 'intro_text_html', 'intro_text_plain',
+                      'before', 'after')
+
+
+def count_subquery(queryset):
+    """Row count of `queryset` (grouped by its values() column) as a
+    correlated subquery, 0 when it has no rows"""
+    return Coalesce(Subquery(queryset.annotate(n=Count('pk')).values('n')), 0)
+
+
 class Course(models.Model):
     """This Model Describe Course data"""
     slug = models.SlugField(_('slug for url'), unique=True)
@@ -187,7 +260,8 @@ class Course(models.Model):
                                     blank=True, default=None)
     files = models.FileField(_("""Attached Files in Zip and named
                                as course title"""), null=True,
-                             blank=True, upload_to='CF')
+                             blank=True, upload_to='CF',
+                             storage=ProtectedStorage())
     is_approved = models.BooleanField(verbose_name=_('Is Approved By Admin ?'),
                                       default=False)
 
@@ -196,6 +270,11 @@ class Course(models.Model):
     skills_covered = models.ManyToManyField(to=Skill, related_name='courses',
                                             verbose_name=_('Skiils Covered in Course'))
     intro_text = RichTextUploadingField(_('Course Text introduction'))
+    # rendered from intro_text on save, see website/richtext.py
+    intro_text_html = models.TextField(default='', editable=False)
+    intro_text_plain = models.TextField(default='', editable=False)
+    intro_text_summary = models.CharField(max_length=255, default='',
+                                          editable=False)
     intro_video = models.URLField(_('introduction video'),
                                   help_text=_('This should be embed YouTube link'))
     before = models.TextField(_('Before the course'),
@@ -213,18 +292,35 @@ class Course(models.Model):
                               verbose_name=_('Level'),
                               blank=True, null=True)
 
+    objects = CourseManager()
+    RICH_TEXT_FIELDS = ('intro_text',)
+
     def __str__(self):
         return self.title
 
+    def get_stats(self):
+        """Return the course counters, building them if missing"""
+        try:
+            return self.stats
+        except CourseStats.DoesNotExist:
+            CourseStats.rebuild(Course.objects.filter(pk=self.pk))
+            self.stats = CourseStats.objects.get(course=self.pk)
+            return self.stats
+
+    def get_outline(self):
+        """Units in order, each with its ordered lessons prefetched
+        (2 queries for the whole course)"""
+        lessons = Lesson.objects.order_by('arrange').only(
+            'name', 'arrange', 'unit')
+        return (self.units.order_by('arrange').only('name', 'arrange', 'course')
+                .prefetch_related(Prefetch('lessons', queryset=lessons)))
+
     def get_lessons_num(self):
-        i = 0
-        for d in Unit.objects.filter(course=self.pk):
-            i += d.get_lessons_num()
-        return i
+        return self.get_stats().lessons
     get_lessons_num.short_description = _('Lessons Number')
 
     def get_units_num(self):
-        return Unit.objects.filter(course=self.pk).count()
+        return self.get_stats().units
 
     def save(self, *args, **kwargs):
         if (self.is_approved) and (self.pub_date is None):
@@ -235,6 +331,10 @@ class Course(models.Model):
         verbose_name = _('Course')
         verbose_name_plural = _('Courses')
         ordering = ['pub_date']
+        indexes = [
+            models.Index(fields=['is_approved', 'category', 'pub_date']),
+            models.Index(fields=['is_approved', 'slug']),
+        ]
 
 
 class Unit(models.Model):
@@ -243,13 +343,21 @@ class Unit(models.Model):
                                on_delete=models.CASCADE,
                                related_name='units')
     desc = RichTextUploadingField(verbose_name=_('Description'))
+    # rendered from desc on save, see website/richtext.py
+    desc_html = models.TextField(default='', editable=False)
+    desc_plain = models.TextField(default='', editable=False)
+    desc_summary = models.CharField(max_length=255, default='',
+                                    editable=False)
     arrange = models.IntegerField(verbose_name=_('Unit Arrange'), validators=[
         MinValueValidator(1, _('Arrange start at \'1\''))], default=1)
 
+    RICH_TEXT_FIELDS = ('desc',)
+
     class Meta:
         verbose_name = _('Unit')
         verbose_name_plural = _('Units')
         unique_together = [['arrange', 'course']]
+        indexes = [models.Index(fields=['course', 'arrange'])]
 
     def __str__(self):
         return self.name
@@ -273,8 +381,12 @@ class Quiz(models.Model):
     ch4 = models.CharField(_('False 4'), max_length=255,
                            null=True, blank=True)
 
+    @staticmethod
+    def normalize(answer):
+        return str(answer).lower()
+
     def check_answer(self, answer):
-        return (str(answer).lower() == str(self.answer).lower())
+        return (self.normalize(answer) == self.normalize(self.answer))
 
     def __str__(self):
         return self.question
@@ -296,6 +408,11 @@ class Lesson(models.Model):
                              related_name='lessons')
     host = models.ForeignKey(Host, verbose_name=_('Host'),
                              on_delete=models.PROTECT)
+    # host.before + video + host.after, sanitized on save
+    video_html = models.TextField(default='', editable=False)
+
+    def render_video(self, host):
+        self.video_html = embed(host.before, self.video, host.after)
 
     def __str__(self):
         return self.name + ' unit : ' + self.unit.name
@@ -304,6 +421,30 @@ class Lesson(models.Model):
         verbose_name = _('Lesson')
         verbose_name_plural = _('Lessons')
         unique_together = [['arrange', 'unit']]
+        indexes = [models.Index(fields=['unit', 'arrange'])]
+
+
+class RelManager(models.Manager):
+
+    def dashboard(self, student):
+        """Enrollments of `student`, most recently active first, with
+        their course, its stats and the lessons/quizzes attended and totals,
+        all in one query"""
+        attended = Rel.lessons_attended.through.objects.filter(
+            rel=OuterRef('pk')).values('rel')
+        solved = Rel.quizzes_solved.through.objects.filter(
+            rel=OuterRef('pk')).values('rel')
+        quizzes = Quiz.objects.filter(
+            unit__course=OuterRef('course')).values('unit__course')
+        return (self.filter(student=student)
+                .select_related('course', 'course__stats')
+                .defer('lessons_bits', 'quizzes_bits', *(
+                    'course__' + f for f in COURSE_BODY_FIELDS))
+                .annotate(lessons_done=count_subquery(attended),
+                          quizzes_done=count_subquery(solved),
+                          quizzes_total=count_subquery(quizzes))
+                .order_by(F('last_activity').desc(nulls_last=True),
+                          '-join_date'))
 
 
 class Rel(models.Model):
@@ -328,16 +469,134 @@ class Rel(models.Model):
     feedback = models.CharField(
         _('Review'), max_length=255, blank=True, null=True)
     join_date = models.DateTimeField(_('Join Date'), auto_now_add=True)
+    last_activity = models.DateTimeField(_('Last activity'), null=True,
+                                         blank=True, editable=False)
+
+    # Bitsets mirroring lessons_attended and quizzes_solved,
+    # see website/progress.py
+    lessons_bits = models.BinaryField(default=b'', editable=False)
+    quizzes_bits = models.BinaryField(default=b'', editable=False)
+    progress_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RelManager()
+
+    def get_progress(self):
+        from .progress import get_progress
+        return get_progress(self)
 
     def is_attended(self, lesson_id):
-        return self.lessons_attended.filter(pk=lesson_id).exists()
+        return self.get_progress().is_attended(lesson_id)
 
     def __str__(self):
         return str(self.course) + ' ' + str(self.student)
     
     class Meta:
         unique_together = [['course', 'student']]
+        indexes = [models.Index(fields=['student', 'rel_type'])]
+
+
+
+class CourseStats(models.Model):
+    """Denormalized counters of one course, kept up to date by the
+    signals in website/signals.py and rebuilt by `rebuild_course_stats`"""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='stats')
+    units = models.PositiveIntegerField(_('Units'), default=0)
+    lessons = models.PositiveIntegerField(_('Lessons'), default=0)
+    enrollments = models.PositiveIntegerField(_('Active enrollments'), default=0)
+    finished = models.PositiveIntegerField(_('Finished'), default=0)
+    rating_sum = models.PositiveIntegerField(_('Rating sum'), default=0)
+    rating_count = models.PositiveIntegerField(_('Rating count'), default=0)
+    content_version = models.PositiveIntegerField(_('Content version'),
+                                                  default=1)
+
+    @property
+    def students(self):
+        return self.enrollments + self.finished
+
+    @property
+    def rating_avg(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
+
+    @classmethod
+    def rebuild(cls, courses=None):
+        """Recompute the counters of `courses` (all courses by default)
+        with one aggregate query per counter group"""
+        if courses is None:
+            courses = Course.objects.all()
+        units = Unit.objects.filter(course=OuterRef('pk')).values('course')
+        lessons = Lesson.objects.filter(
+            unit__course=OuterRef('pk')).values('unit__course')
+        rels = Rel.objects.filter(course=OuterRef('pk')).values('course')
+
+        rows = courses.annotate(
+            n_units=count_subquery(units),
+            n_lessons=count_subquery(lessons),
+            n_enrollments=count_subquery(rels.filter(rel_type=Rel.ENROLLMENT)),
+            n_finished=count_subquery(rels.filter(rel_type=Rel.FINISHED)),
+            n_rating_sum=Subquery(rels.annotate(n=Sum('rating')).values('n')),
+            n_rating_count=count_subquery(rels.filter(rating__isnull=False)),
+        ).values_list('pk', 'n_units', 'n_lessons', 'n_enrollments',
+                      'n_finished', 'n_rating_sum', 'n_rating_count')
+        for pk, *counters in rows.iterator():
+            counters = [n or 0 for n in counters]
+            cls.objects.update_or_create(course_id=pk, defaults=dict(zip(
+                ('units', 'lessons', 'enrollments', 'finished',
+                 'rating_sum', 'rating_count'), counters)))
 
+    def __str__(self):
+        return str(self.course_id)
+
+    class Meta:
+        verbose_name = _('Course Stats')
+        verbose_name_plural = _('Course Stats')
+
+
+class Upload(models.Model):
+    """One content-addressed CKEditor upload, see website/uploads.py.
+    `refs` counts the saved objects whose rich text links to it (its
+    UploadLink rows)"""
+    digest = models.CharField(_('SHA-256'), max_length=64, primary_key=True)
+    name = models.CharField(_('Path'), max_length=255)
+    size = models.PositiveIntegerField(_('Size'))
+    refs = models.PositiveIntegerField(_('References'), default=0)
+    uploaded = models.DateTimeField(_('Last uploaded'), default=timezone.now)
+    # filled by website/responsive.py for images
+    width = models.PositiveIntegerField(_('Width'), null=True, blank=True)
+    height = models.PositiveIntegerField(_('Height'), null=True, blank=True)
+    variants = models.CharField(_('Variant widths'), max_length=100,
+                                null=True, blank=True,
+                                help_text=_('Comma separated, unset until '
+                                            'the image is processed'))
+
+    @property
+    def variant_widths(self):
+        return [int(w) for w in (self.variants or '').split(',') if w]
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _('Upload')
+        verbose_name_plural = _('Uploads')
+        indexes = [models.Index(fields=['refs', 'uploaded'])]
+
+
+class UploadLink(models.Model):
+    """A saved object whose rich text links to an Upload, kept by the
+    signals of website/signals.py; Upload.refs counts them"""
+    upload = models.ForeignKey(Upload, on_delete=models.CASCADE,
+                               related_name='links')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = _('Upload link')
+        verbose_name_plural = _('Upload links')
+        unique_together = [['upload', 'content_type', 'object_id']]
+        indexes = [models.Index(fields=['content_type', 'object_id'])]
 
 
 class NewsTeller(models.Model):
@@ -357,3 +616,30 @@ class NewsTeller_Emails(models.Model):
     class Meta:
         verbose_name = _('NewsTeller Email')
         verbose_name_plural = _('NewsTeller Emails')
+
+
+class NewsTellerDelivery(models.Model):
+    """Delivery state of one NewsTeller_Emails message to one subscriber,
+    lets website/newsletter.py queue a sending and resume it without
+    resending"""
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    message = models.ForeignKey(NewsTeller_Emails, on_delete=models.CASCADE,
+                                related_name='deliveries')
+    subscriber = models.ForeignKey(NewsTeller, on_delete=models.CASCADE,
+                                   related_name='deliveries')
+    status = models.IntegerField(choices=STATUS_CHOICES)
+    date = models.DateTimeField(_('Date'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('NewsTeller Delivery')
+        verbose_name_plural = _('NewsTeller Deliveries')
+        unique_together = [['message', 'subscriber']]
+        indexes = [models.Index(fields=['status', 'message'])]
@@ -0,0 +1,179 @@
+"""Mass sending of NewsTeller_Emails messages to NewsTeller subscribers.
+
+The main thread streams the subscribers still waiting for the message with
+a server-side iterator, cuts them in batches and hands the batches to a
+pool of worker threads. Each worker keeps one open mail connection for its
+whole life. The main thread records the outcome of every batch in
+NewsTellerDelivery, so a crashed run can be restarted: only the batches
+that were in flight (at most two per worker) are mailed again.
+
+The admin does not send anything itself: `queue` stores a PENDING delivery
+per subscriber and the send_newsletter command, run without a message id
+from cron or a worker, sends the messages having some.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef
+
+from . import models
+
+
+class RateLimiter:
+    """Allow at most `rate` calls per second across threads (0 = no limit)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(self.next_at, now)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Sender:
+    """Send batches over one mail connection per worker thread"""
+
+    def __init__(self, message, rate=0, backend=None):
+        self.subject = message.subject
+        self.body = message.msg
+        self.from_email = getattr(settings, 'NEWSLETTER_FROM_EMAIL',
+                                  settings.DEFAULT_FROM_EMAIL)
+        self.backend = backend or getattr(settings, 'NEWSLETTER_EMAIL_BACKEND',
+                                          None)
+        self.limiter = RateLimiter(rate)
+        self.local = threading.local()
+        self.connections = []
+
+    def connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = get_connection(self.backend)
+            self.local.connection.open()
+            self.connections.append(self.local.connection)
+        return self.local.connection
+
+    def send_batch(self, batch):
+        """Send to [(subscriber_id, email)], return (sent_ids, failed_ids)"""
+        sent, failed = [], []
+        for pk, email in batch:
+            self.limiter.wait()
+            try:
+                EmailMessage(self.subject, self.body, self.from_email, [email],
+                             connection=self.connection()).send()
+            except Exception:
+                # drop the connection, the next mail opens a fresh one
+                self.local.connection = None
+                failed.append(pk)
+            else:
+                sent.append(pk)
+        return sent, failed
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def pending_subscribers(message):
+    sent = models.NewsTellerDelivery.objects.filter(
+        message=message, subscriber=OuterRef('pk'),
+        status=models.NewsTellerDelivery.SENT)
+    return (models.NewsTeller.objects.filter(is_subscribe=True)
+            .annotate(sent=Exists(sent)).filter(sent=False)
+            .order_by('pk').values_list('pk', 'email'))
+
+
+def record(message, ids, status):
+    if not ids:
+        return
+    Delivery = models.NewsTellerDelivery
+    Delivery.objects.filter(message=message, subscriber__in=ids).update(
+        status=status)
+    Delivery.objects.bulk_create(
+        [Delivery(message=message, subscriber_id=pk, status=status)
+         for pk in ids], ignore_conflicts=True)
+
+
+def queue(message, batch_size=1000):
+    """Queue `message` for every subscriber that did not get it yet"""
+    Delivery = models.NewsTellerDelivery
+    rows = pending_subscribers(message).iterator(chunk_size=batch_size)
+    for batch in batches(rows, batch_size):
+        Delivery.objects.bulk_create(
+            [Delivery(message=message, subscriber_id=pk,
+                      status=Delivery.PENDING) for pk, email in batch],
+            ignore_conflicts=True)
+
+
+def queued_messages():
+    pending = models.NewsTellerDelivery.objects.filter(
+        message=OuterRef('pk'), status=models.NewsTellerDelivery.PENDING)
+    return (models.NewsTeller_Emails.objects.annotate(queued=Exists(pending))
+            .filter(queued=True).order_by('pk'))
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def send_newsletter(message, workers=4, batch_size=100, rate=0, backend=None,
+                    progress=None):
+    """Send `message` to every subscriber that did not get it yet.
+
+    `rate` limits the messages per second over all workers, `progress` is
+    called with the running report after every batch. Returns the report:
+    sent, failed, seconds and per_second.
+    """
+    sender = Sender(message, rate=rate, backend=backend)
+    report = {'sent': 0, 'failed': 0}
+    started = time.monotonic()
+
+    def collect(done):
+        for future in done:
+            sent, failed = future.result()
+            record(message, sent, models.NewsTellerDelivery.SENT)
+            record(message, failed, models.NewsTellerDelivery.FAILED)
+            report['sent'] += len(sent)
+            report['failed'] += len(failed)
+            if progress:
+                progress(report)
+
+    rows = pending_subscribers(message).iterator(chunk_size=batch_size * 10)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running = set()
+            for batch in batches(rows, batch_size):
+                running.add(pool.submit(sender.send_batch, batch))
+                if len(running) >= workers * 2:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(wait(running).done)
+    finally:
+        sender.close()
+    # left by subscribers gone meanwhile, the message is done
+    models.NewsTellerDelivery.objects.filter(
+        message=message, status=models.NewsTellerDelivery.PENDING).delete()
+
+    report['seconds'] = round(time.monotonic() - started, 2)
+    report['per_second'] = round(
+        report['sent'] / report['seconds'], 1) if report['seconds'] else 0
+    return report
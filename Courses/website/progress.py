@@ -0,0 +1,130 @@
+"""Compact student progress stored on Rel as two bitsets.
+
+Bit `i` of `Rel.lessons_bits` is set when the student attended the i-th
+lesson of the course (ordered by unit arrange then lesson arrange), and the
+same for `Rel.quizzes_bits` and quizzes. The positions of a course are
+cached per `CourseStats.content_version`; a Rel built against an older
+version is rebuilt from its M2M tables on first use. Code writing the M2M
+rows resets `Rel.progress_version` to 0 after writing them.
+"""
+from django.core.cache import cache
+
+from . import models
+
+# progress_version of a Rel while `rebuild` reads its M2M rows
+BUILDING = 2 ** 31 - 1
+
+
+class CourseIndex:
+    """Ordered lesson and quiz ids of one course version"""
+
+    def __init__(self, lesson_ids, quiz_ids):
+        self.lesson_ids = tuple(lesson_ids)
+        self.quiz_ids = tuple(quiz_ids)
+        self.lesson_pos = {pk: i for i, pk in enumerate(self.lesson_ids)}
+        self.quiz_pos = {pk: i for i, pk in enumerate(self.quiz_ids)}
+
+
+def course_index(course_id, version):
+    key = 'progress:index:%s:%s' % (course_id, version)
+    index = cache.get(key)
+    if index is None:
+        lessons = models.Lesson.objects.filter(unit__course=course_id).order_by(
+            'unit__arrange', 'arrange').values_list('pk', flat=True)
+        quizzes = models.Quiz.objects.filter(unit__course=course_id).order_by(
+            'unit__arrange', 'pk').values_list('pk', flat=True)
+        index = CourseIndex(lessons, quizzes)
+        cache.set(key, index, 60 * 60 * 24)
+    return index
+
+
+def to_int(bits):
+    return int.from_bytes(bytes(bits or b''), 'little')
+
+
+def to_bytes(number):
+    return number.to_bytes((number.bit_length() + 7) // 8, 'little')
+
+
+def positions_to_int(positions):
+    number = 0
+    for pos in positions:
+        number |= 1 << pos
+    return number
+
+
+class Progress:
+
+    def __init__(self, index, lessons, quizzes):
+        self.index = index
+        self.lessons = lessons
+        self.quizzes = quizzes
+
+    def is_attended(self, lesson_id):
+        pos = self.index.lesson_pos.get(lesson_id)
+        return pos is not None and bool(self.lessons >> pos & 1)
+
+    def is_solved(self, quiz_id):
+        pos = self.index.quiz_pos.get(quiz_id)
+        return pos is not None and bool(self.quizzes >> pos & 1)
+
+    @property
+    def lessons_done(self):
+        return bin(self.lessons).count('1')
+
+    @property
+    def lessons_total(self):
+        return len(self.index.lesson_ids)
+
+    @property
+    def quizzes_done(self):
+        return bin(self.quizzes).count('1')
+
+    @property
+    def quizzes_total(self):
+        return len(self.index.quiz_ids)
+
+    @property
+    def percent(self):
+        if not self.lessons_total:
+            return 0
+        return round(100 * self.lessons_done / self.lessons_total)
+
+    def remaining_lessons(self):
+        """Ids of the lessons not attended yet, in course order"""
+        return [pk for i, pk in enumerate(self.index.lesson_ids)
+                if not self.lessons >> i & 1]
+
+
+def rebuild(rel, version):
+    """Recompute the bitsets of `rel` from its M2M rows.
+
+    The row is marked BUILDING first and only written if still marked, so
+    a lesson attended or quiz solved while reading (which resets the
+    version to 0) is not covered by a stale rebuild.
+    """
+    models.Rel.objects.filter(pk=rel.pk).update(progress_version=BUILDING)
+    index = course_index(rel.course_id, version)
+    lessons = positions_to_int(
+        index.lesson_pos[pk]
+        for pk in rel.lessons_attended.values_list('pk', flat=True)
+        if pk in index.lesson_pos)
+    quizzes = positions_to_int(
+        index.quiz_pos[pk]
+        for pk in rel.quizzes_solved.values_list('pk', flat=True)
+        if pk in index.quiz_pos)
+    rel.lessons_bits = to_bytes(lessons)
+    rel.quizzes_bits = to_bytes(quizzes)
+    rel.progress_version = version
+    models.Rel.objects.filter(pk=rel.pk, progress_version=BUILDING).update(
+        lessons_bits=rel.lessons_bits, quizzes_bits=rel.quizzes_bits,
+        progress_version=version)
+
+
+def get_progress(rel):
+    version = rel.course.get_stats().content_version
+    if rel.progress_version != version:
+        rebuild(rel, version)
+    return Progress(course_index(rel.course_id, version),
+                    to_int(rel.lessons_bits), to_int(rel.quizzes_bits))
+
@@ -0,0 +1,46 @@
+"""Grading all the quizzes of a unit in one submission.
+
+The answer key of a unit is cached per CourseStats.content_version (bumped
+on every Quiz change), and solved quizzes are stored with one bulk INSERT
+that ignores rows already present.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import models
+
+
+def answer_key(unit_id, course_id, version):
+    """{quiz_id: normalized answer} of the unit quizzes"""
+    key = 'quizzes:answers:%s:%s:%s' % (course_id, unit_id, version)
+    answers = cache.get(key)
+    if answers is None:
+        answers = {pk: models.Quiz.normalize(answer) for pk, answer in
+                   models.Quiz.objects.filter(unit=unit_id, unit__course=course_id)
+                   .values_list('pk', 'answer')}
+        cache.set(key, answers, 60 * 60 * 24)
+    return answers
+
+
+def grade_unit(rel, unit_id, answers):
+    """Grade `answers` ({quiz_id: answer}) against the unit of `rel.course`.
+
+    Records the correct ones as solved and returns {quiz_id: correct} for
+    every quiz of the unit (unanswered quizzes count as wrong), or None if
+    the unit has no quizzes in this course.
+    """
+    key = answer_key(unit_id, rel.course_id, rel.course.get_stats().content_version)
+    if not key:
+        return None
+    results = {pk: models.Quiz.normalize(answers.get(pk, '')) == right
+               for pk, right in key.items()}
+    solved = [pk for pk, ok in results.items() if ok]
+    updates = {'last_activity': timezone.now()}
+    if solved:
+        through = models.Rel.quizzes_solved.through
+        through.objects.bulk_create(
+            [through(rel_id=rel.pk, quiz_id=pk) for pk in solved],
+            ignore_conflicts=True)
+        updates['progress_version'] = 0
+    models.Rel.objects.filter(pk=rel.pk).update(**updates)
+    return results
@@ -0,0 +1,62 @@
+"""Process-local cache for the small reference tables
+(Category, Host, Language, Level, Tag and Skill).
+
+Every process keeps its own copy of each table. A version token per model
+lives in the shared Django cache, so bumping it on save/delete makes all
+workers reload the table on their next access.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import models
+
+CACHED_MODELS = (models.Category, models.Host, models.Language,
+                 models.Level, models.Tag, models.Skill)
+
+_local = {}
+
+
+def _shared():
+    return caches[getattr(settings, 'REFDATA_CACHE', 'default')]
+
+
+def _version_key(model):
+    return 'refdata:version:%s' % model._meta.label_lower
+
+
+def _current_version(model):
+    version = _shared().get(_version_key(model))
+    if version is None:
+        version = uuid4().hex
+        if not _shared().add(_version_key(model), version, None):
+            version = _shared().get(_version_key(model))
+    return version
+
+
+def invalidate(model):
+    """Make every process reload `model` on next access"""
+    _shared().set(_version_key(model), uuid4().hex, None)
+    _local.pop(model, None)
+
+
+def _entry(model):
+    version = _current_version(model)
+    entry = _local.get(model)
+    if entry is None or entry['version'] != version:
+        objects = tuple(model.objects.all())
+        entry = {'version': version, 'objects': objects,
+                 'by_pk': {obj.pk: obj for obj in objects}}
+        _local[model] = entry
+    return entry
+
+
+def all(model):
+    """All rows of `model` in its default ordering"""
+    return _entry(model)['objects']
+
+
+def get(model, pk):
+    """Row of `model` with primary key `pk` or None"""
+    return _entry(model)['by_pk'].get(pk)
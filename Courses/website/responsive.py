@@ -0,0 +1,174 @@
+"""Resized variants of the images embedded in rich text.
+
+Every image upload (website/uploads.py) linked from a rich text field gets
+one WebP file per width of RESPONSIVE_IMAGE_WIDTHS narrower than itself,
+`uploads/.variants/<d[:2]>/<d[2:4]>/<digest>_<width>.webp`. Saving rich
+text schedules the missing ones the way website/thumbnails.py does, in a
+small thread pool after the transaction commits. `lookup` gives
+`richtext.render` the `srcset`, `sizes` and intrinsic width/height of the
+images already processed; when a job is done the objects linking to the
+image are rendered again.
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+from . import models, richtext, uploads
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = getattr(settings, 'RESPONSIVE_IMAGE_WIDTHS', (320, 640, 960, 1280))
+# the width of the content column
+SIZES = getattr(settings, 'RESPONSIVE_IMAGE_SIZES',
+                '(max-width: 800px) 100vw, 800px')
+
+WEBP_OPTIONS = {'quality': 80, 'method': 4}
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='responsive')
+_px = {name: re.compile(r'(?:^|;)\s*%s:\s*(\d+)px' % name)
+       for name in ('width', 'height')}
+
+
+def style_px(img, name):
+    """The CSS `name` of an <img> in px, None when not set in px"""
+    match = _px[name].search(img.get('style', ''))
+    return int(match.group(1)) if match else None
+
+
+def generate(upload):
+    """Write the variants of an Upload, return (width, height, widths)"""
+    with default_storage.open(upload.name) as f:
+        image = Image.open(f)
+        animated = getattr(image, 'is_animated', False)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    width, height = image.size
+    if animated:
+        return width, height, []
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    widths = [w for w in WIDTHS if w < width]
+    for w in widths:
+        resized = image.resize((w, max(1, round(height * w / width))),
+                               Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, 'WEBP', **WEBP_OPTIONS)
+        target = uploads.variant_name(upload.digest, w, 'webp')
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+    return width, height, widths
+
+
+def sizes(img):
+    """`sizes` of an <img>: its CSS or attribute width, else the column"""
+    width = str(style_px(img, 'width') or img.get('width', ''))
+    return '%spx' % width if width.isdigit() else SIZES
+
+
+def image_attrs(found):
+    """`richtext.render` images hook for the Uploads `found` by digest"""
+    def attrs(img):
+        upload = found.get(uploads.blob_digest(img.get('src')))
+        if upload is None or not upload.width:
+            return []
+        extra = []
+        if 'width' not in img and 'height' not in img:
+            width, height = style_px(img, 'width'), style_px(img, 'height')
+            if width is None and height is None:
+                extra += [('width', str(upload.width)),
+                          ('height', str(upload.height))]
+            elif height is None:
+                # the aspect ratio of the image at the width of the style
+                extra += [('width', str(width)), ('height', str(
+                    max(1, round(upload.height * width / upload.width))))]
+        srcset = ['%s %dw' % (default_storage.url(
+            uploads.variant_name(upload.digest, w, 'webp')), w)
+            for w in upload.variant_widths]
+        if srcset:
+            srcset.append('%s %dw' % (img['src'], upload.width))
+            extra += [('srcset', ', '.join(srcset)), ('sizes', sizes(img))]
+        return extra
+    return attrs
+
+
+def lookup(instance):
+    """images hook for the rich text of `instance`; the blobs not
+    processed yet are left for `schedule_missing`"""
+    instance._missing_variants = []
+    digests = uploads.instance_blobs(instance)
+    if not digests:
+        return None
+    found = models.Upload.objects.in_bulk(digests)
+    instance._missing_variants = [upload.digest for upload in found.values()
+                                  if upload.variants is None]
+    return image_attrs(found)
+
+
+def schedule_missing(instance):
+    """Schedule the blobs `lookup` found unprocessed, once `instance` is
+    saved so the job renders its new content"""
+    for digest in getattr(instance, '_missing_variants', ()):
+        schedule(digest)
+    instance._missing_variants = []
+
+
+def rerender(digest):
+    """Render again the rich text of the objects linking to a blob.
+
+    An object saved meanwhile was rendered by its own save, so a row is
+    only written while its source text is still the one rendered here.
+    """
+    for model, pks in uploads.linking_objects(digest):
+        fields = model.RICH_TEXT_FIELDS
+        for obj in model._default_manager.filter(pk__in=pks).only(*fields):
+            richtext.render_fields(obj, images=lookup(obj))
+            source = {name: getattr(obj, name) for name in fields}
+            model._default_manager.filter(pk=obj.pk, **source).update(**{
+                name + suffix: getattr(obj, name + suffix)
+                for name in fields
+                for suffix in ('_html', '_plain', '_summary')})
+            schedule_missing(obj)
+
+
+def process(digest, force=False):
+    """Build the variants of a blob and render the objects using it"""
+    upload = models.Upload.objects.filter(digest=digest).first()
+    if upload is None or (upload.variants is not None and not force):
+        return
+    try:
+        width, height, widths = generate(upload)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        width = height = None
+        widths = []
+    models.Upload.objects.filter(digest=digest).update(
+        width=width, height=height,
+        variants=','.join(str(w) for w in widths))
+    if width:
+        rerender(digest)
+
+
+def _process_in_thread(digest):
+    close_old_connections()
+    try:
+        process(digest)
+    except Exception:
+        logger.exception('Variants of %s failed', digest)
+    finally:
+        connection.close()
+
+
+def schedule(digest):
+    """Build the variants of a blob after the current transaction"""
+    if getattr(settings, 'THUMBNAILS_ASYNC', True):
+        transaction.on_commit(
+            lambda: _pool.submit(_process_in_thread, digest))
+    else:
+        transaction.on_commit(lambda: process(digest))
@@ -0,0 +1,216 @@
+"""Save-time rendering of the CKEditor fields.
+
+`render` turns editor HTML into three stored forms: the sanitized HTML
+(allow-listed tags, attributes, CSS properties and URL schemes, tags
+balanced, comments and scripts dropped), a plain-text extract and a short
+summary. Models list their rich text fields in `RICH_TEXT_FIELDS` and
+website/signals.py fills `<field>_html`, `<field>_plain` and
+`<field>_summary` before every save, so templates only read a column.
+
+Images are lazy loaded; the `images` hook of `render` adds what is known
+about them (website/responsive.py: srcset, sizes, intrinsic size).
+
+`embed` builds the sanitized video embed of a lesson from its host's
+before/after snippets. This module does not import the models, so
+migrations can use it.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.utils.text import Truncator
+
+SUMMARY_LENGTH = 200
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'code', 'del', 'div',
+    'em', 'figcaption', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+# dropped with everything inside them
+DROP_CONTENT_TAGS = {'script', 'style', 'template', 'object', 'embed',
+                     'iframe', 'noscript', 'textarea', 'select', 'title'}
+BLOCK_TAGS = {'blockquote', 'br', 'div', 'figcaption', 'h1', 'h2', 'h3',
+              'h4', 'h5', 'h6', 'hr', 'li', 'p', 'pre', 'tr'}
+
+ALLOWED_ATTRS = {
+    '*': {'title', 'dir', 'lang', 'style'},
+    'a': {'href', 'target'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'iframe': {'src', 'width', 'height', 'frameborder', 'allow',
+               'allowfullscreen'},
+    'ol': {'start', 'type'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+}
+URL_ATTRS = {'href', 'src'}
+URL_SCHEMES = {'', 'http', 'https', 'mailto'}
+
+ALLOWED_STYLES = {
+    'background-color', 'border', 'border-collapse', 'border-width', 'color',
+    'float', 'font-style', 'font-weight', 'height', 'margin', 'margin-left',
+    'margin-right', 'padding', 'text-align', 'text-decoration', 'width',
+}
+_unsafe_css = re.compile(r'url\s*\(|expression|\\|<', re.I)
+
+
+def clean_url(url):
+    url = re.sub(r'[\x00-\x20]', '', url or '')
+    try:
+        scheme = urlsplit(url).scheme.lower()
+    except ValueError:
+        return None
+    return url if scheme in URL_SCHEMES else None
+
+
+def clean_style(style):
+    kept = []
+    for declaration in style.split(';'):
+        prop, sep, value = declaration.partition(':')
+        prop, value = prop.strip().lower(), value.strip()
+        if sep and prop in ALLOWED_STYLES and value and not _unsafe_css.search(value):
+            kept.append('%s: %s' % (prop, value))
+    return '; '.join(kept)
+
+
+class Sanitizer(HTMLParser):
+
+    def __init__(self, allowed_tags, images=None):
+        super().__init__(convert_charrefs=True)
+        self.allowed_tags = allowed_tags
+        self.images = images
+        self.out = []
+        self.open = []
+        self.dropping = None
+
+    def clean_attrs(self, tag, attrs):
+        allowed = ALLOWED_ATTRS['*'] | ALLOWED_ATTRS.get(tag, set())
+        cleaned = []
+        for name, value in attrs:
+            if name not in allowed:
+                continue
+            value = value or ''
+            if name in URL_ATTRS:
+                value = clean_url(value)
+                if value is None:
+                    continue
+            elif name == 'style':
+                value = clean_style(value)
+                if not value:
+                    continue
+            cleaned.append((name, value))
+        if tag == 'a' and ('target', '_blank') in cleaned:
+            cleaned.append(('rel', 'noopener noreferrer'))
+        if tag == 'img':
+            if self.images is not None:
+                cleaned.extend(self.images(dict(cleaned)))
+            cleaned.extend([('loading', 'lazy'), ('decoding', 'async')])
+        return ''.join(' %s="%s"' % (n, escape(v)) for n, v in cleaned)
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping:
+            return
+        if tag not in self.allowed_tags:
+            if tag in DROP_CONTENT_TAGS:
+                self.dropping = tag
+            return
+        self.out.append('<%s%s>' % (tag, self.clean_attrs(tag, attrs)))
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open and self.open[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            if tag == self.dropping:
+                self.dropping = None
+            return
+        if tag not in self.open:
+            return
+        while self.open:
+            current = self.open.pop()
+            self.out.append('</%s>' % current)
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(escape(data, quote=False))
+
+    def result(self):
+        self.close()
+        return ''.join(self.out + ['</%s>' % t for t in reversed(self.open)])
+
+
+class TextExtractor(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.dropping = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping is None and tag in DROP_CONTENT_TAGS:
+            self.dropping = tag
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag == self.dropping:
+            self.dropping = None
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self.dropping is None:
+            self.parts.append(data)
+
+    def result(self):
+        self.close()
+        lines = (' '.join(line.split()) for line in ''.join(self.parts).split('\n'))
+        return '\n'.join(line for line in lines if line)
+
+
+def sanitize(html, allowed_tags=ALLOWED_TAGS, images=None):
+    parser = Sanitizer(allowed_tags, images)
+    parser.feed(html or '')
+    return parser.result()
+
+
+def to_text(html):
+    parser = TextExtractor()
+    parser.feed(html or '')
+    return parser.result()
+
+
+def summarize(text, length=SUMMARY_LENGTH):
+    return Truncator(' '.join(text.split())).chars(length)
+
+
+def render(html, images=None):
+    """(sanitized html, plain text, summary) of editor HTML, `images`
+    maps the attributes of an <img> to the (name, value) pairs to add"""
+    clean = sanitize(html, images=images)
+    text = to_text(clean)
+    return clean, text, summarize(text)
+
+
+def render_fields(instance, names=None, images=None):
+    """Fill the rendered columns of `instance`'s rich text fields"""
+    for name in names or instance.RICH_TEXT_FIELDS:
+        clean, text, summary = render(getattr(instance, name), images)
+        setattr(instance, name + '_html', clean)
+        setattr(instance, name + '_plain', text)
+        setattr(instance, name + '_summary', summary)
+
+
+def embed(before, url, after):
+    """Sanitized `before + url + after` video embed of a lesson"""
+    return sanitize((before or '') + escape(url or '') + (after or ''),
+                    ALLOWED_TAGS | {'iframe'})
@@ -0,0 +1,186 @@
+"""Full-text search over approved courses.
+
+The backend is chosen with the SEARCH_BACKEND setting (dotted path).
+`SQLiteFTSBackend` keeps an FTS5 table (created by migration 0004) with one
+row per approved course, ranked with bm25. `BasicBackend` is a non-indexed
+fallback for databases without a dedicated backend.
+"""
+import re
+from html import escape
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from . import models
+
+FTS_TABLE = 'website_course_fts'
+
+# column name -> bm25 weight, in table order
+FTS_COLUMNS = (
+    ('title', 10.0),
+    ('intro_text', 1.0),
+    ('before', 1.0),
+    ('after', 1.0),
+    ('tags', 5.0),
+    ('skills', 5.0),
+    ('instructor', 3.0),
+)
+
+# snippet() markers, swapped for <mark> once the text is escaped
+_START, _END = '\x02', '\x03'
+
+
+def course_document(course):
+    """Plain text of every indexed column of `course`"""
+    instructor = course.instructor
+    return {
+        'title': course.title,
+        'intro_text': course.intro_text_plain,
+        'before': course.before,
+        'after': course.after,
+        'tags': ' '.join(t.name for t in course.tags.all()),
+        'skills': ' '.join(s.name for s in course.skills_covered.all()),
+        'instructor': '%s %s' % (instructor.first_name, instructor.last_name),
+    }
+
+
+def indexable(courses):
+    return (courses.filter(is_approved=True)
+            .select_related('instructor')
+            .prefetch_related('tags', 'skills_covered'))
+
+
+class SearchHit:
+    def __init__(self, course_id, rank, snippet):
+        self.course_id = course_id
+        self.rank = rank
+        self.snippet = snippet
+
+
+class BaseSearchBackend:
+
+    def index_courses(self, courses):
+        """(Re)index `courses`, dropping the unapproved ones"""
+        raise NotImplementedError
+
+    def remove_courses(self, course_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, limit=50):
+        """List of SearchHit, best first"""
+        raise NotImplementedError
+
+    def rebuild(self):
+        self.clear()
+        self.index_courses(models.Course.objects.all())
+
+
+class BasicBackend(BaseSearchBackend):
+    """Non-indexed icontains search, no index to maintain"""
+
+    def index_courses(self, courses):
+        pass
+
+    def remove_courses(self, course_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit=50):
+        qs = models.Course.objects.approved()
+        for word in query.split():
+            qs = qs.filter(title__icontains=word) | qs.filter(tags__name__iexact=word)
+        ids = qs.values_list('pk', flat=True).distinct()[:limit]
+        return [SearchHit(pk, 0, '') for pk in ids]
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    CHUNK_SIZE = 500
+
+    def index_courses(self, courses):
+        ids = [c.pk for c in courses]
+        for i in range(0, len(ids), self.CHUNK_SIZE):
+            self._index_chunk(ids[i:i + self.CHUNK_SIZE])
+
+    def _index_chunk(self, ids):
+        self.remove_courses(ids)
+        rows = [(c.pk, *course_document(c).values())
+                for c in indexable(models.Course.objects.filter(pk__in=ids))]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    'INSERT INTO %s (rowid, %s) VALUES (%s)' % (
+                        FTS_TABLE, ', '.join(c for c, _ in FTS_COLUMNS),
+                        ', '.join(['%s'] * (len(FTS_COLUMNS) + 1))),
+                    rows)
+
+    def remove_courses(self, course_ids):
+        course_ids = list(course_ids)
+        if course_ids:
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (
+                    FTS_TABLE, ', '.join(['%s'] * len(course_ids))), course_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+
+    @staticmethod
+    def match_expression(query):
+        """Quote every word of the user query as an FTS5 prefix phrase"""
+        words = re.findall(r'\w+', query)
+        return ' '.join('"%s"*' % w for w in words)
+
+    def search(self, query, limit=50):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for _, w in FTS_COLUMNS)
+        sql = ("SELECT rowid, bm25({t}, {w}), "
+               "snippet({t}, -1, %s, %s, '...', 16) "
+               "FROM {t} WHERE {t} MATCH %s "
+               "ORDER BY bm25({t}, {w}) LIMIT %s").format(t=FTS_TABLE, w=weights)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [_START, _END, match, limit])
+            rows = cursor.fetchall()
+        return [SearchHit(pk, rank, self.highlight(snippet))
+                for pk, rank, snippet in rows]
+
+    @staticmethod
+    def highlight(snippet):
+        return (escape(snippet).replace(_START, '<mark>')
+                .replace(_END, '</mark>'))
+
+
+_backend = None
+
+
+def backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(
+            settings, 'SEARCH_BACKEND', 'website.search.BasicBackend'))()
+    return _backend
+
+
+def search_courses(query, limit=50):
+    """Approved courses matching `query` best first, each with a
+    `search_snippet` attribute"""
+    hits = backend().search(query, limit)
+    courses = (models.Course.objects.approved()
+               .defer(*models.COURSE_BODY_FIELDS)
+               .select_related('instructor')
+               .prefetch_related('tags')
+               .in_bulk([h.course_id for h in hits]))
+    result = []
+    for hit in hits:
+        course = courses.get(hit.course_id)
+        if course is not None:
+            course.search_snippet = hit.snippet
+            result.append(course)
+    return result
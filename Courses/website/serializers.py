@@ -2,3 +2,89 @@ from rest_framework import serializers
 from . import models
 
 # Your Serializers
+
+
+class SparseFieldsMixin:
+    """Limit the output to the comma separated `?fields=` query param"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request and request.query_params.get('fields')
+        if fields:
+            wanted = set(fields.split(','))
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    desc = serializers.CharField(source='desc_html', read_only=True)
+
+    class Meta:
+        model = models.Category
+        fields = ('id', 'name', 'slug', 'desc')
+
+
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    category = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+    instructor = serializers.StringRelatedField()
+    language = serializers.StringRelatedField()
+    level = serializers.StringRelatedField()
+    tags = serializers.StringRelatedField(many=True)
+    skills_covered = serializers.StringRelatedField(many=True)
+    units = serializers.IntegerField(source='get_stats.units',
+                                     read_only=True)
+    lessons = serializers.IntegerField(source='get_stats.lessons',
+                                       read_only=True)
+    students = serializers.IntegerField(source='get_stats.students',
+                                        read_only=True)
+    rating = serializers.FloatField(source='get_stats.rating_avg',
+                                    read_only=True)
+    summary = serializers.CharField(source='intro_text_summary', read_only=True)
+    intro_text = serializers.CharField(source='intro_text_html', read_only=True)
+
+    class Meta:
+        model = models.Course
+        fields = ('id', 'slug', 'title', 'category', 'instructor', 'time',
+                  'pub_date', 'language', 'level', 'tags', 'skills_covered',
+                  'summary', 'intro_text', 'intro_video', 'before', 'after',
+                  'units', 'lessons', 'students', 'rating')
+
+
+class LessonSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.Lesson
+        fields = ('id', 'name', 'arrange')
+
+
+class UnitOutlineSerializer(serializers.ModelSerializer):
+    lessons = LessonSerializer(many=True)
+
+    class Meta:
+        model = models.Unit
+        fields = ('id', 'name', 'arrange', 'lessons')
+
+
+class EnrollmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    course = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+    title = serializers.CharField(source='course.title')
+    status = serializers.CharField(source='get_rel_type_display')
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.Rel
+        fields = ('id', 'course', 'title', 'status', 'join_date',
+                  'rating', 'progress')
+
+    def get_progress(self, rel):
+        # annotated by Rel.objects.dashboard
+        lessons_total = rel.course.get_stats().lessons
+        return {
+            'lessons_done': rel.lessons_done,
+            'lessons_total': lessons_total,
+            'quizzes_done': rel.quizzes_done,
+            'quizzes_total': rel.quizzes_total,
+            'percent': (min(100, round(100 * rel.lessons_done / lessons_total))
+                        if lessons_total else 0),
+        }
@@ -0,0 +1,77 @@
+"""Session engine: Django's cached_db store with a small in-process LRU
+in front of the cache.
+
+A session read by this process is served from memory for
+SESSION_LOCAL_CACHE_TTL seconds, so most requests touch neither the
+cache nor the DB. Saves and deletes made by this process update the LRU
+at once. Changes made by other processes (a logout in another worker)
+show up here after at most the TTL.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import \
+    SessionStore as CachedDBStore
+
+
+class LocalLRU:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        ttl = getattr(settings, 'SESSION_LOCAL_CACHE_TTL', 5)
+        size = getattr(settings, 'SESSION_LOCAL_CACHE_SIZE', 1000)
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.data[key] = (time.monotonic() + ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+local = LocalLRU()
+
+
+class SessionStore(CachedDBStore):
+
+    def load(self):
+        if self.session_key is not None:
+            data = local.get(self.session_key)
+            if data is not None:
+                return data
+        data = super().load()
+        if self.session_key is not None and data:
+            local.set(self.session_key, data)
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        local.set(self.session_key, self._session)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        if session_key is not None:
+            local.delete(session_key)
+        super().delete(session_key)
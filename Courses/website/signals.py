@@ -0,0 +1,331 @@
+from django.db.models import DEFERRED, F
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import (progress, refdata, responsive, richtext, search, thumbnails,
+               uploads, usercache)
+from .models import (Category, Course, CourseStats, Host, Lesson, Quiz, Rel,
+                     Skill, Tag, Unit, User)
+
+# --- CourseStats counters ---
+
+
+def bump_stats(course_filter, **deltas):
+    """Add `deltas` to the CourseStats row(s) matched by `course_filter`"""
+    deltas = {k: F(k) + v for k, v in deltas.items() if v}
+    if deltas:
+        CourseStats.objects.filter(**course_filter).update(**deltas)
+
+
+def rel_counters(rel):
+    """What one Rel row adds to its course counters"""
+    return {
+        'enrollments': int(rel.rel_type == Rel.ENROLLMENT),
+        'finished': int(rel.rel_type == Rel.FINISHED),
+        'rating_sum': rel.rating or 0,
+        'rating_count': int(rel.rating is not None),
+    }
+
+
+@receiver(post_save, sender=Course)
+def create_course_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CourseStats.objects.get_or_create(course=instance)
+
+
+@receiver(post_save, sender=Unit)
+def unit_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        bump_stats({'course': instance.course_id},
+                   units=int(created), content_version=1)
+
+
+@receiver(post_delete, sender=Unit)
+def unit_deleted(sender, instance, **kwargs):
+    bump_stats({'course': instance.course_id}, units=-1, content_version=1)
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        bump_stats({'course__units': instance.unit_id},
+                   lessons=int(created), content_version=1)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, **kwargs):
+    bump_stats({'course__units': instance.unit_id},
+               lessons=-1, content_version=1)
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def quiz_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_stats({'course__units': instance.unit_id}, content_version=1)
+
+
+@receiver(pre_save, sender=Rel)
+def rel_remember_counters(sender, instance, raw=False, **kwargs):
+    old = None
+    if instance.pk and not raw:
+        old = Rel.objects.filter(pk=instance.pk).only(
+            'rel_type', 'rating').first()
+    instance._old_counters = rel_counters(old) if old else None
+
+
+@receiver(post_save, sender=Rel)
+def rel_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = rel_counters(instance)
+    old = getattr(instance, '_old_counters', None) or dict.fromkeys(new, 0)
+    bump_stats({'course': instance.course_id},
+               **{k: new[k] - old[k] for k in new})
+
+
+@receiver(post_delete, sender=Rel)
+def rel_deleted(sender, instance, **kwargs):
+    bump_stats({'course': instance.course_id},
+               **{k: -v for k, v in rel_counters(instance).items()})
+
+
+# --- Reference data cache ---
+
+
+def refdata_changed(sender, **kwargs):
+    refdata.invalidate(sender)
+
+
+for model in refdata.CACHED_MODELS:
+    post_save.connect(refdata_changed, sender=model,
+                      dispatch_uid='refdata_save_%s' % model._meta.label_lower)
+    post_delete.connect(refdata_changed, sender=model,
+                        dispatch_uid='refdata_delete_%s' % model._meta.label_lower)
+
+
+# --- Course search index ---
+
+
+@receiver(post_save, sender=Course)
+def course_reindex(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.backend().index_courses([instance])
+
+
+@receiver(post_delete, sender=Course)
+def course_unindex(sender, instance, **kwargs):
+    search.backend().remove_courses([instance.pk])
+
+
+@receiver(m2m_changed, sender=Course.tags.through)
+@receiver(m2m_changed, sender=Course.skills_covered.through)
+def course_labels_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # post_clear has no pk_set, remember the courses losing the label
+        instance._cleared_courses = list(
+            instance.courses.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_courses', ())
+        search.backend().index_courses(
+            Course.objects.filter(pk__in=pk_set or ()).only('pk'))
+    else:
+        search.backend().index_courses([instance])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Skill)
+def course_label_renamed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        search.backend().index_courses(instance.courses.only('pk'))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Skill)
+def course_label_remember(sender, instance, **kwargs):
+    # the cascade deletes the m2m rows without m2m_changed
+    instance._labelled_courses = list(
+        instance.courses.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Skill)
+def course_label_deleted(sender, instance, **kwargs):
+    search.backend().index_courses(Course.objects.filter(
+        pk__in=getattr(instance, '_labelled_courses', ())).only('pk'))
+
+
+def instructor_name(instance):
+    """(first name, last name) as loaded, DEFERRED for unloaded fields"""
+    return tuple(instance.__dict__.get(name, DEFERRED)
+                 for name in ('first_name', 'last_name'))
+
+
+@receiver(post_init, sender=User)
+def instructor_remember_name(sender, instance, **kwargs):
+    instance._indexed_name = instructor_name(instance)
+
+
+@receiver(post_save, sender=User)
+def instructor_renamed(sender, instance, created, raw=False, **kwargs):
+    # the instructor column of the index holds the names
+    saved, instance._indexed_name = (instance._indexed_name,
+                                     instructor_name(instance))
+    if (not created and not raw and DEFERRED not in saved and
+            saved != instance._indexed_name):
+        search.backend().index_courses(
+            instance.courses_instructor.only('pk'))
+
+
+# --- Rel progress bitsets ---
+
+
+@receiver(m2m_changed, sender=Rel.lessons_attended.through)
+@receiver(m2m_changed, sender=Rel.quizzes_solved.through)
+def rel_progress_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # post_clear has no pk_set, remember the Rels losing a row
+        instance._cleared_rels = list(sender.objects.filter(**{
+            instance._meta.model_name: instance.pk}).values_list(
+                'rel_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_rels', ())
+        Rel.objects.filter(pk__in=pk_set or ()).update(progress_version=0)
+    else:
+        progress.rebuild(instance, instance.course.get_stats().content_version)
+
+
+# --- User.pic thumbnails ---
+
+
+def loaded_pic(instance):
+    """Name of the loaded User.pic, DEFERRED when the field is not loaded"""
+    if 'pic' not in instance.__dict__:
+        return DEFERRED
+    value = instance.__dict__['pic']
+    return getattr(value, 'name', value)
+
+
+def pic_changed(instance):
+    saved = getattr(instance, '_saved_pic', DEFERRED)
+    current = loaded_pic(instance)
+    return DEFERRED not in (saved, current) and current != saved
+
+
+@receiver(post_init, sender=User)
+def user_remember_pic(sender, instance, **kwargs):
+    # reading instance.pic would load a deferred field
+    instance._saved_pic = loaded_pic(instance)
+
+
+@receiver(pre_save, sender=User)
+def user_pic_changed(sender, instance, **kwargs):
+    if pic_changed(instance):
+        instance.pic_thumbs = False
+
+
+@receiver(post_save, sender=User)
+def user_schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if pic_changed(instance):
+        instance._saved_pic = loaded_pic(instance)
+        if instance.pic and not raw:
+            thumbnails.schedule(instance)
+
+
+# --- Cached users and enrollments, see website/usercache.py ---
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    usercache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Rel)
+def rel_enrollment_changed(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_counters', None)
+    new = rel_counters(instance)
+    if created or old is None or any(
+            old[k] != new[k] for k in ('enrollments', 'finished')):
+        usercache.invalidate_enrolled(instance.student_id)
+
+
+@receiver(post_delete, sender=Rel)
+def rel_enrollment_deleted(sender, instance, **kwargs):
+    usercache.invalidate_enrolled(instance.student_id)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_card_changed(sender, instance, **kwargs):
+    usercache.invalidate_course(instance.pk)
+
+
+# --- Rendered rich text, see website/richtext.py ---
+
+
+def render_rich_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(sender.RICH_TEXT_FIELDS):
+        richtext.render_fields(instance, images=responsive.lookup(instance))
+
+
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        responsive.schedule_missing(instance)
+
+
+for model in (Category, Course, Unit, User):
+    pre_save.connect(render_rich_text, sender=model,
+                     dispatch_uid='richtext_%s' % model._meta.label_lower)
+    post_save.connect(schedule_image_variants, sender=model,
+                      dispatch_uid='image_variants_%s' % model._meta.label_lower)
+
+
+@receiver(pre_save, sender=Lesson)
+def lesson_render_video(sender, instance, **kwargs):
+    instance.render_video(refdata.get(Host, instance.host_id) or instance.host)
+
+
+@receiver(post_save, sender=Host)
+def host_render_videos(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    batch = []
+    for lesson in Lesson.objects.filter(host=instance).only('video').iterator():
+        lesson.render_video(instance)
+        batch.append(lesson)
+        if len(batch) == 1000:
+            Lesson.objects.bulk_update(batch, ['video_html'])
+            batch = []
+    Lesson.objects.bulk_update(batch, ['video_html'])
+
+
+# --- Upload links and reference counts, see website/uploads.py ---
+
+
+def uploads_link(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and
+               not set(update_fields) & set(sender.RICH_TEXT_FIELDS)):
+        return
+    uploads.link(instance)
+
+
+def uploads_release(sender, instance, **kwargs):
+    uploads.unlink(instance)
+
+
+for model in (Category, Course, Unit, User):
+    label = model._meta.label_lower
+    post_save.connect(uploads_link, sender=model,
+                      dispatch_uid='uploads_link_%s' % label)
+    post_delete.connect(uploads_release, sender=model,
+                        dispatch_uid='uploads_release_%s' % label)
@@ -0,0 +1,101 @@
+"""Content hashed, precompressed static files and the view serving them.
+
+`collectstatic` with CompressedManifestStaticFilesStorage writes hashed
+copies of every file (`base.1a2b3c4d5e6f.css`) plus `.gz` and, when the
+optional `brotli` package is installed, `.br` siblings of the text assets.
+`serve` picks the best sibling the client accepts and marks hashed names
+as immutable, so the files can be served without a front proxy.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json',
+                       '.map', '.xml', '.ico', '.ttf', '.eot', '.md')
+
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def compress_file(path):
+    """Write `path`.gz (and `path`.br) when they are smaller than `path`"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    encoders = [('.gz', lambda d: gzip.compress(d, 9, mtime=0))]
+    if brotli is not None:
+        encoders.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    for suffix, encode in encoders:
+        compressed = encode(data)
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in names:
+            if name.endswith(COMPRESS_EXTENSIONS) and self.exists(name):
+                compress_file(self.path(name))
+
+
+def accepted_encodings(request):
+    accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    tokens = {part.split(';')[0].strip() for part in accept.split(',')}
+    return [(enc, suffix) for enc, suffix in (('br', '.br'), ('gzip', '.gz'))
+            if enc in tokens]
+
+
+def serve(request, path, document_root=None):
+    """Serve a file of STATIC_ROOT, precompressed when possible"""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root or settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    encoding = None
+    for enc, suffix in accepted_encodings(request):
+        if os.path.isfile(fullpath + suffix):
+            encoding, fullpath = enc, fullpath + suffix
+            break
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(path)
+        response = FileResponse(open(fullpath, 'rb'),
+                                content_type=content_type or
+                                'application/octet-stream')
+        response['Content-Length'] = stat.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = (IMMUTABLE if HASHED_NAME.search(path)
+                                 else 'public, max-age=60')
+    return response
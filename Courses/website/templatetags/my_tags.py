@@ -1,4 +1,6 @@
 from django import template
+from django.utils.html import format_html
+from website import refdata, thumbnails, usercache
 from website.models import Category
 
 
@@ -6,11 +8,40 @@ register = template.Library()
 
 
 def getC():
-    cats = Category.objects.only('name', 'slug')
-    return cats
+    return refdata.all(Category)
 register.simple_tag(getC)
 
 
+@register.simple_tag
+def enrolled_courses(user):
+    if not user.is_authenticated:
+        return []
+    return usercache.enrolled_courses(user.pk)
+
+
 @register.filter(is_safe=True)
 def good(value):
     return value
+
+
+@register.filter
+def avatar_url(user, size='medium'):
+    return thumbnails.variant_url(user, size)
+
+
+@register.simple_tag
+def avatar(user, size='medium'):
+    """<picture> of the user pic with a WebP source and a JPEG fallback,
+    a plain <img> of the original until the variants exist"""
+    if not user.pic:
+        return ''
+    width = thumbnails.THUMBNAIL_SIZES[size]
+    if not user.pic_thumbs:
+        return format_html(
+            '<img src="{}" width="{}" alt="{}" loading="lazy">',
+            user.pic.url, width, user)
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp">'
+        '<img src="{}" width="{}" alt="{}" loading="lazy"></picture>',
+        thumbnails.variant_url(user, size, 'webp'),
+        thumbnails.variant_url(user, size), width, user)
@@ -1,8 +1,90 @@
-from django.test import TestCase
-from selenium import webdriver
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.http import Http404, HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-# Create your tests here.
+from PIL import Image
+
+from . import (attendance, coursepack, db, hotpaths, metrics, refdata,
+               responsive, richtext, search, staticfiles, thumbnails, uploads,
+               usercache)
+from .models import (Category, Course, CourseStats, Host, Lesson, NewsTeller,
+                     NewsTeller_Emails, NewsTellerDelivery, Quiz, Rel, Skill,
+                     Tag, Unit, Upload, User)
+from .templatetags import my_tags
+
+
+def generate_catalog(**options):
+    """A small catalog from the `generate_catalog` command"""
+    options = dict(dict(categories=3, instructors=2, courses=12, units=2,
+                        lessons=3, quizzes=2, students=4, enrollments=2,
+                        verbosity=0), **options)
+    call_command('generate_catalog', stdout=StringIO(), **options)
+
+
+# the manifest of CompressedManifestStaticFilesStorage needs collectstatic
+PLAIN_STATIC = override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+class CacheClearMixin:
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+
+@PLAIN_STATIC
+class QueryPlanTest(CacheClearMixin, TestCase):
+    """No query of the hot views scans a whole large table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog()
+
+    def test_scan_pattern(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite plan format')
+        self.assertEqual(hotpaths.full_scans([
+            'SCAN website_course',
+            'SCAN TABLE website_unit AS U0',
+            'SCAN website_lesson USING COVERING INDEX website_les_unit_id',
+            'SEARCH website_rel USING INDEX website_rel_student (student_id=?)',
+            'SCAN website_tag',
+            'SCAN CONSTANT ROW',
+        ]), {'website_course', 'website_unit', 'website_lesson'})
+
+    def test_hot_views_use_indexes(self):
+        if connection.vendor not in hotpaths.EXPLAIN:
+            self.skipTest('No plan check for %s' % connection.vendor)
+        scenarios, student = hotpaths.scenarios()
+        self.client.force_login(student)
+        for name, method, url, needs_login in scenarios:
+            with self.subTest(view=name):
+                with CaptureQueriesContext(connection) as captured:
+                    response = getattr(self.client, method)(url)
+                self.assertLess(response.status_code, 400)
+                for sql in hotpaths.explainable(captured):
+                    self.assertFalse(
+                        hotpaths.full_scans(hotpaths.explain(sql)), sql)
 """
 class FunctionalTest(TestCase):
 
@@ -21,3 +103,748 @@ class FunctionalTest(TestCase):
         self.browser.quit()
 
 """
+
+
+@PLAIN_STATIC
+class UserCacheTest(CacheClearMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('staff@example.com', 'password',
+                                             is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+
+    def test_update_drops_cached_user(self):
+        self.assertEqual(self.client.get(reverse('admin:index')).status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        self.assertEqual(self.client.get(reverse('admin:index')).status_code, 302)
+
+    def test_not_staff_action(self):
+        other = User.objects.create_user('other@example.com', 'password',
+                                         is_staff=True)
+        client = self.client_class()
+        client.force_login(other)
+        self.assertEqual(client.get(reverse('admin:index')).status_code, 200)
+        self.client.post(reverse('admin:website_user_changelist'), {
+            'action': 'not_staff', '_selected_action': [other.pk]})
+        self.assertEqual(client.get(reverse('admin:index')).status_code, 302)
+
+
+@PLAIN_STATIC
+class ApiTest(CacheClearMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog(enrollments=5)
+        cls.student = User.objects.get(email='gen-student-0@example.com')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured), response.json()
+
+    def test_enrollments_queries_do_not_grow_with_page_size(self):
+        self.client.force_login(self.student)
+        url = reverse('enrollment-list') + '?page_size=%d'
+        self.client.get(url % 1)  # cache the request user
+        for rel in Rel.objects.filter(student=self.student):
+            lesson = Lesson.objects.filter(unit__course=rel.course_id).last()
+            attendance.record(self.student, [lesson.pk])
+        small, _ = self.count_queries(url % 1)
+        for rel in Rel.objects.filter(student=self.student):
+            lesson = Lesson.objects.filter(unit__course=rel.course_id).first()
+            attendance.record(self.student, [lesson.pk])
+        large, data = self.count_queries(url % 5)
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['results']), 5)
+        for item in data['results']:
+            rel = Rel.objects.get(pk=item['id'])
+            self.assertEqual(item['progress']['lessons_done'],
+                             rel.lessons_attended.count())
+
+    def test_course_without_stats_row(self):
+        rel = Rel.objects.filter(student=self.student).first()
+        rel.course.stats.delete()
+        self.client.force_login(self.student)
+        _, data = self.count_queries(reverse('enrollment-list'))
+        item = next(i for i in data['results'] if i['id'] == rel.pk)
+        self.assertEqual(item['progress']['lessons_total'],
+                         rel.course.units.aggregate(n=Count('lessons'))['n'])
+
+    def test_rich_text_is_sanitized(self):
+        course = Course.objects.approved().first()
+        course.intro_text = '<p onclick="x()">Hi<script>alert(1)</script></p>'
+        course.save()
+        data = self.client.get(reverse('course-detail', args=[course.slug])).json()
+        self.assertEqual(data['intro_text'], '<p>Hi</p>')
+
+
+@PLAIN_STATIC
+class CourseFilesTest(CacheClearMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog()
+        cls.rel = Rel.objects.select_related('course', 'student').filter(
+            course__is_approved=True).first()
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(PROTECTED_MEDIA_ROOT=root,
+                                     MEDIA_ROOT=os.path.join(root, 'media'))
+        override.enable()
+        self.addCleanup(override.disable)
+        course = self.rel.course
+        course.files.save('course.zip', ContentFile(bytes(range(256)) * 4))
+        self.url = reverse('course_files', args=[course.slug])
+        self.client.force_login(self.rel.student)
+
+    def test_not_under_media(self):
+        name = self.rel.course.files.name
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)))
+        self.client.logout()
+        self.assertEqual(self.client.get(settings.MEDIA_URL + name).status_code, 404)
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(252, 256)))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        for header in (etag, 'W/' + etag, '"other", ' + etag, '*'):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_students_get_404(self):
+        other = User.objects.exclude(details__course=self.rel.course).exclude(
+            is_staff=True).exclude(courses_instructor=self.rel.course).first()
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(THUMBNAILS_ASYNC=False)
+class UserPicTest(CacheClearMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(MEDIA_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('pic@example.com', 'password')
+
+    def test_deferred_pic_is_not_loaded(self):
+        User.objects.create_user('other@example.com', 'password')
+        with self.assertNumQueries(1):
+            users = list(User.objects.only('email'))
+        self.assertEqual(len(users), 2)
+        with self.assertNumQueries(1):
+            users[0].save(update_fields=['email'])
+
+    def test_thumbnails_refresh_cached_user(self):
+        usercache.get_user(self.user.pk)
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(buffer, 'PNG')
+        self.user.pic.save('pic.png', ContentFile(buffer.getvalue()))
+        self.assertFalse(usercache.get_user(self.user.pk).pic_thumbs)
+        # scheduled on commit, which TestCase never reaches
+        thumbnails.process(self.user.pk, self.user.pic.name)
+        self.assertTrue(usercache.get_user(self.user.pk).pic_thumbs)
+
+    def test_avatar_webp_source_only_with_variants(self):
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(buffer, 'PNG')
+        self.user.pic.save('pic.png', ContentFile(buffer.getvalue()))
+        html = my_tags.avatar(self.user)
+        self.assertNotIn('<source', html)
+        self.assertIn('src="%s"' % self.user.pic.url, html)
+        thumbnails.process(self.user.pk, self.user.pic.name)
+        self.user.refresh_from_db()
+        html = my_tags.avatar(self.user)
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(thumbnails.variant_url(self.user, 'medium', 'webp'), html)
+        self.assertIn('_medium.jpg', html)
+
+
+class UploadTest(TestCase):
+
+    def setUp(self):
+        self.first, self.second = [
+            Upload.objects.create(digest=c * 64, name='uploads/%s.png' % c,
+                                  size=1, width=1000, height=500, variants='')
+            for c in 'ab']
+
+    def img(self, upload, attrs=''):
+        return '<img src="/media/uploads/%s/%s/%s.png"%s>' % (
+            upload.digest[:2], upload.digest[2:4], upload.digest, attrs)
+
+    def refs(self):
+        return dict(Upload.objects.values_list('digest', 'refs'))
+
+    def test_links_follow_saves_and_deletes(self):
+        category = Category.objects.create(name='c', slug='c',
+                                           desc=self.img(self.first))
+        self.assertEqual(self.refs(), {self.first.pk: 1, self.second.pk: 0})
+        category.desc = self.img(self.second)
+        category.save()
+        self.assertEqual(self.refs(), {self.first.pk: 0, self.second.pk: 1})
+        category.delete()
+        self.assertEqual(self.refs(), {self.first.pk: 0, self.second.pk: 0})
+
+    def test_style_width_scales_height(self):
+        attrs = responsive.image_attrs({self.first.pk: self.first})
+        src = '/media/uploads/aa/aa/%s.png' % self.first.pk
+        self.assertEqual(attrs({'src': src}),
+                         [('width', '1000'), ('height', '500')])
+        self.assertEqual(attrs({'src': src, 'style': 'width: 300px'}),
+                         [('width', '300'), ('height', '150')])
+        self.assertEqual(attrs({'src': src, 'style': 'height: 100px'}), [])
+
+    def test_rerender_keeps_newer_saves(self):
+        category = Category.objects.create(name='c', slug='c',
+                                           desc=self.img(self.first))
+        render_fields = richtext.render_fields
+
+        def save_meanwhile(obj, *args, **kwargs):
+            render_fields(obj, *args, **kwargs)
+            Category.objects.filter(pk=obj.pk).update(
+                desc='<p>new</p>', desc_html='<p>new</p>')
+
+        with mock.patch.object(richtext, 'render_fields', save_meanwhile):
+            responsive.rerender(self.first.pk)
+        category.refresh_from_db()
+        self.assertEqual(category.desc_html, '<p>new</p>')
+        Category.objects.filter(pk=category.pk).update(desc=self.img(self.first))
+        responsive.rerender(self.first.pk)
+        category.refresh_from_db()
+        self.assertIn('width="1000"', category.desc_html)
+
+
+class LessonAdminTest(TestCase):
+
+    def test_instructor_edits_own_lessons(self):
+        generate_catalog(courses=2)
+        lesson = Lesson.objects.select_related('unit__course').first()
+        lesson_admin = site._registry[Lesson]
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=lesson.unit.course.instructor_id)
+        self.assertEqual(lesson_admin.get_readonly_fields(request, lesson),
+                         ['unit'])
+        request.user = User.objects.filter(is_instructor=True).exclude(
+            pk=lesson.unit.course.instructor_id).first()
+        self.assertIn('text', lesson_admin.get_readonly_fields(request, lesson))
+
+
+@PLAIN_STATIC
+class SearchIndexTest(CacheClearMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        generate_catalog(courses=3)
+        self.course = Course.objects.filter(is_approved=True).first()
+
+    def found(self, query):
+        return self.course.pk in {
+            hit.course_id for hit in search.backend().search(query)}
+
+    def test_tag_clear_and_delete(self):
+        tag = Tag.objects.create(name='zebra', desc='')
+        self.course.tags.add(tag)
+        self.assertTrue(self.found('zebra'))
+        tag.courses.clear()
+        self.assertFalse(self.found('zebra'))
+        self.course.tags.add(tag)
+        tag.delete()
+        self.assertFalse(self.found('zebra'))
+
+    def test_approve_action(self):
+        self.course.is_approved = False
+        self.course.title = 'Quokka course'
+        self.course.save()
+        self.assertFalse(self.found('quokka'))
+        self.client.force_login(User.objects.create_user(
+            'admin@example.com', 'password', is_staff=True, is_superuser=True))
+        self.client.post(
+            reverse('admin:website_course_changelist') + '?is_approved__exact=0',
+            {'action': 'approve', '_selected_action': [self.course.pk]})
+        self.assertTrue(self.found('quokka'))
+
+    def test_instructor_rename(self):
+        instructor = User.objects.get(pk=self.course.instructor_id)
+        instructor.last_name = 'Quokka'
+        instructor.save()
+        self.assertTrue(self.found('quokka'))
+
+
+@PLAIN_STATIC
+class CourseOutlineTest(CacheClearMixin, TestCase):
+
+    def test_slug_change_refreshes_unit_links(self):
+        generate_catalog(courses=2)
+        course = Course.objects.filter(is_approved=True).first()
+        self.client.get(reverse('course', args=[course.slug]))
+        course.slug = 'renamed'
+        course.save()
+        response = self.client.get(reverse('course', args=['renamed']))
+        self.assertContains(response, '/course/renamed/')
+
+
+@PLAIN_STATIC
+class NewsletterTest(CacheClearMixin, TestCase):
+
+    def test_admin_queues_and_command_sends(self):
+        NewsTeller.objects.bulk_create([
+            NewsTeller(email='s%d@example.com' % i) for i in range(5)])
+        message = NewsTeller_Emails.objects.create(subject='News', msg='Hi')
+        self.client.force_login(User.objects.create_user(
+            'admin@example.com', 'password', is_staff=True, is_superuser=True))
+        self.client.post(reverse('admin:website_newsteller_emails_changelist'),
+                         {'action': 'SEND_EMAIL',
+                          '_selected_action': [message.pk]})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(message.deliveries.filter(
+            status=NewsTellerDelivery.PENDING).count(), 5)
+        call_command('send_newsletter', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(message.deliveries.filter(
+            status=NewsTellerDelivery.SENT).count(), 5)
+
+
+class AttendTest(TestCase):
+
+    def setUp(self):
+        generate_catalog(courses=4, enrollments=1)
+        self.rel = Rel.objects.select_related('student').first()
+        self.lessons = list(Lesson.objects.filter(
+            unit__course=self.rel.course_id).exclude(
+                pk__in=self.rel.lessons_attended.all()))
+        self.client.force_login(self.rel.student)
+
+    def test_post_only_and_accepted(self):
+        lesson = self.lessons[0]
+        url = reverse('attend_url', args=[lesson.pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'recorded': [lesson.pk]})
+        # resending is harmless
+        self.assertEqual(self.client.post(url).status_code, 202)
+        self.assertTrue(self.rel.lessons_attended.filter(pk=lesson.pk).exists())
+
+    def test_batch(self):
+        url = reverse('attend_batch')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        other = Lesson.objects.exclude(
+            unit__course__details__student=self.rel.student).first()
+        done = self.rel.get_progress().lessons_done
+        mine = sorted(lesson.pk for lesson in self.lessons[:2])
+        response = self.client.post(
+            url, {'lessons': mine + [other.pk, 999999]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'recorded': mine,
+                                           'rejected': [other.pk, 999999]})
+        rel = Rel.objects.get(pk=self.rel.pk)
+        self.assertEqual(rel.get_progress().lessons_done, done + 2)
+        self.assertEqual(self.client.post(
+            url, {'lesson': mine}, content_type='application/json'
+        ).status_code, 400)
+
+
+class ContentAddressedStorageTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.storage = uploads.ContentAddressedStorage(location=self.root)
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.storage.save('a.png', ContentFile(b'same bytes'))
+        second = self.storage.save('other/b.PNG', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.png'))
+        self.assertEqual(Upload.objects.get().name, first)
+        directory = os.path.dirname(self.storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+
+    def test_stale_temporary_file(self):
+        content = ContentFile(b'after a crash')
+        name = uploads.blob_name(uploads.file_digest(content), '.txt')
+        os.makedirs(os.path.dirname(self.storage.path(name)))
+        stale = '%s.%s.tmp' % (self.storage.path(name), os.getpid())
+        with open(stale, 'wb') as f:
+            f.write(b'partial')
+        self.assertEqual(self.storage.save('notes.txt', content), name)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'after a crash')
+
+
+@PLAIN_STATIC
+class DiscoverTest(CacheClearMixin, TestCase):
+
+    def test_top_courses_per_category(self):
+        generate_catalog(categories=3, courses=30)
+        expected = []
+        for category in Category.objects.order_by('pk'):
+            top = list(category.get_courses().order_by('pub_date')
+                       .values_list('pk', flat=True)[:5])
+            if len(top) >= 3:
+                expected.append(top)
+        self.assertTrue(expected)
+        self.client.get(reverse('discover'))  # cache the menu categories
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('discover'))
+        self.assertEqual([[course.pk for course in group]
+                          for group in response.context['quesyset']],
+                         expected)
+
+
+class CourseStatsTest(TestCase):
+
+    COUNTERS = ('units', 'lessons', 'enrollments', 'finished', 'rating_sum',
+                'rating_count')
+
+    def setUp(self):
+        generate_catalog(courses=1, enrollments=1)
+        self.course = Course.objects.get()
+        self.expected = self.counters()
+
+    def counters(self):
+        return CourseStats.objects.filter(course=self.course).values(
+            *self.COUNTERS).get()
+
+    def assertCounters(self, **deltas):
+        for name, delta in deltas.items():
+            self.expected[name] += delta
+        self.assertEqual(self.counters(), self.expected)
+
+    def test_rebuild_agrees(self):
+        CourseStats.rebuild()
+        self.assertEqual(self.counters(), self.expected)
+
+    def test_units_and_lessons(self):
+        unit = Unit.objects.create(course=self.course, name='u', desc='',
+                                   arrange=99)
+        self.assertCounters(units=1)
+        lessons = [Lesson.objects.create(unit=unit, name='l', text='',
+                                         arrange=arrange,
+                                         host=Host.objects.first(),
+                                         video='https://example.com/v')
+                   for arrange in (1, 2)]
+        self.assertCounters(lessons=2)
+        lessons[0].delete()
+        self.assertCounters(lessons=-1)
+        unit.delete()
+        self.assertCounters(units=-1, lessons=-1)
+
+    def test_enrollment_lifecycle(self):
+        student = User.objects.create_user('stats@example.com', 'password')
+        rel = Rel.objects.create(student=student, course=self.course)
+        self.assertCounters(enrollments=1)
+        rel.rel_type = Rel.FINISHED
+        rel.save()
+        self.assertCounters(enrollments=-1, finished=1)
+        rel.rating = 8
+        rel.save()
+        self.assertCounters(rating_sum=8, rating_count=1)
+        rel.rating = 5
+        rel.save()
+        self.assertCounters(rating_sum=-3)
+        rel.delete()
+        self.assertCounters(finished=-1, rating_sum=-5, rating_count=-1)
+
+
+class RefdataTest(CacheClearMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        refdata._local.clear()
+        self.addCleanup(refdata._local.clear)
+        self.tag = Tag.objects.create(name='first', desc='')
+
+    def names(self):
+        return [tag.name for tag in refdata.all(Tag)]
+
+    def test_warm_reads_make_no_query(self):
+        self.assertEqual(self.names(), ['first'])
+        with self.assertNumQueries(0):
+            self.assertEqual(refdata.get(Tag, self.tag.pk), self.tag)
+            self.assertEqual(self.names(), ['first'])
+
+    def test_save_and_delete_reload(self):
+        self.names()
+        self.tag.name = 'renamed'
+        self.tag.save()
+        self.assertEqual(self.names(), ['renamed'])
+        self.tag.delete()
+        self.assertEqual(self.names(), [])
+
+    def test_other_process_copy_is_reloaded(self):
+        self.names()
+        stale = dict(refdata._local)
+        Tag.objects.create(name='second', desc='')
+        # the local copy of a worker that did not handle the save
+        refdata._local.update(stale)
+        self.assertEqual(sorted(self.names()), ['first', 'second'])
+
+
+class UnitQuizzesTest(CacheClearMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        generate_catalog(courses=4, enrollments=1, quizzes=2)
+        self.rel = Rel.objects.filter(course__is_approved=True).select_related(
+            'student', 'course').first()
+        self.unit = Unit.objects.filter(course=self.rel.course).first()
+        self.quizzes = list(self.unit.quizzes.order_by('pk'))
+        self.client.force_login(self.rel.student)
+
+    def grade(self, answers, unit=None):
+        unit = unit or self.unit
+        return self.client.post(
+            reverse('unit_quizzes', args=[unit.course.slug, unit.pk]),
+            {'answers': answers}, content_type='application/json')
+
+    def test_grading(self):
+        right, wrong = self.quizzes
+        response = self.grade({right.pk: right.answer.upper(),
+                               wrong.pk: wrong.answer + ' not'})
+        self.assertEqual(response.json(), {
+            'results': {str(right.pk): True, str(wrong.pk): False},
+            'score': 1})
+        self.assertEqual(
+            list(self.rel.quizzes_solved.filter(unit=self.unit)
+                 .values_list('pk', flat=True)), [right.pk])
+        self.assertEqual(self.grade({}).json()['score'], 0)
+
+    def test_changed_answer_is_used(self):
+        quiz = self.quizzes[0]
+        self.grade({quiz.pk: 'new answer'})
+        quiz.answer = 'New Answer'
+        quiz.save()
+        response = self.grade({quiz.pk: 'new answer'})
+        self.assertTrue(response.json()['results'][str(quiz.pk)])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(reverse(
+            'unit_quizzes', args=[self.rel.course.slug, self.unit.pk])
+        ).status_code, 405)
+        self.assertEqual(self.grade(['not', 'a', 'dict']).status_code, 400)
+        other = Unit.objects.exclude(course=self.rel.course).filter(
+            quizzes__isnull=False).first()
+        # a unit of another course, under this course's slug
+        self.assertEqual(self.client.post(
+            reverse('unit_quizzes', args=[self.rel.course.slug, other.pk]),
+            {'answers': {}}, content_type='application/json'
+        ).status_code, 404)
+
+
+class StaticFilesTest(TestCase):
+
+    def setUp(self):
+        parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parent)
+        self.root = os.path.join(parent, 'static')
+        os.mkdir(self.root)
+        for name, data in [('app.0123456789ab.css', b'plain'),
+                           ('app.0123456789ab.css.gz', b'gzipped'),
+                           ('app.0123456789ab.css.br', b'brotli'),
+                           ('app.css', b'unhashed'),
+                           ('../secret.txt', b'secret')]:
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(data)
+
+    def serve(self, path, accept=''):
+        request = RequestFactory().get('/static/' + path,
+                                       HTTP_ACCEPT_ENCODING=accept)
+        response = staticfiles.serve(request, path, self.root)
+        return response, b''.join(response.streaming_content)
+
+    def test_precompressed_sibling(self):
+        for accept, encoding, body in [
+                ('gzip, deflate, br', 'br', b'brotli'),
+                ('gzip;q=1.0, identity', 'gzip', b'gzipped'),
+                ('', None, b'plain')]:
+            with self.subTest(accept=accept):
+                response, content = self.serve('app.0123456789ab.css', accept)
+                self.assertEqual(content, body)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_cache_control(self):
+        response, _ = self.serve('app.0123456789ab.css')
+        self.assertEqual(response['Cache-Control'], staticfiles.IMMUTABLE)
+        response, _ = self.serve('app.css', 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_path_traversal(self):
+        for path in ('../secret.txt', 'x/../../secret.txt', 'missing.css'):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                self.serve(path)
+
+
+@PLAIN_STATIC
+@override_settings(METRICS_TOKEN='secret', METRICS_DIR=None)
+class MetricsTest(CacheClearMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        saved = metrics.registry.series.copy()
+        metrics.registry.series.clear()
+        self.addCleanup(metrics.registry.series.update, saved)
+        self.addCleanup(metrics.registry.series.clear)
+
+    def test_middleware_records_views(self):
+        sizes = [len(self.client.get(reverse('discover')).content)
+                 for _ in range(2)]
+        series = metrics.registry.snapshot()['discover']
+        self.assertEqual(series['count'], 2)
+        self.assertEqual(sum(series['buckets']), 2)
+        self.assertEqual(series['bytes'], sum(sizes))
+        self.assertGreater(series['queries'], 0)
+        self.assertGreater(series['template_seconds'], 0)
+
+    def test_endpoint(self):
+        self.client.get(reverse('discover'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4')
+        text = response.content.decode()
+        self.assertIn('django_view_request_duration_seconds_count'
+                      '{view="discover"} 1\n', text)
+        self.assertIn('django_view_request_duration_seconds_bucket'
+                      '{view="discover",le="+Inf"} 1\n', text)
+        self.assertIn('# TYPE django_view_db_queries_total counter', text)
+
+    def test_workers_add_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.new_series()
+        other.update(count=3, bytes=10)
+        with open(os.path.join(directory, '1.json'), 'w') as f:
+            json.dump({'discover': other}, f)
+        self.client.get(reverse('discover'))
+        with self.settings(METRICS_DIR=directory):
+            self.assertEqual(metrics.collect()['discover']['count'], 4)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class PrimaryReplicaTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = db.PrimaryReplicaRouter()
+        self.addCleanup(db._state.__dict__.clear)
+
+    def request(self, method='get', **cookies):
+        """(response, whether the view read from 'default')"""
+        seen = {}
+
+        def view(request):
+            seen['pinned'] = db.is_pinned()
+            if request.method == 'POST':
+                self.router.db_for_write(Course)
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+        response = db.PrimaryPinMiddleware(view)(request)
+        return response, seen['pinned']
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Course), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertEqual(self.router.db_for_write(Course), 'default')
+        # reads after a write see it
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+
+    def test_pin_cookie(self):
+        response, pinned = self.request()
+        self.assertFalse(pinned)
+        self.assertNotIn(db.PIN_COOKIE, response.cookies)
+        response, pinned = self.request('post')
+        self.assertTrue(pinned)
+        cookie = response.cookies[db.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        _, pinned = self.request(**{db.PIN_COOKIE: cookie.value})
+        self.assertTrue(pinned)
+        _, pinned = self.request(**{db.PIN_COOKIE: str(int(time.time()) - 1)})
+        self.assertFalse(pinned)
+        self.assertFalse(db.is_pinned())
+
+    def test_use_primary(self):
+        self.assertTrue(db.use_primary(lambda: db.is_pinned())())
+
+
+class CoursePackTest(TestCase):
+
+    def setUp(self):
+        generate_catalog(courses=2, quizzes=2)
+        self.course = Course.objects.order_by('pk').first()
+        self.course.tags.add(Tag.objects.create(name='pack-tag', desc=''))
+        self.course.skills_covered.add(Skill.objects.create(name='pack-skill'))
+
+    def export(self, course, slug=None):
+        lines = list(coursepack.export_courses(
+            Course.objects.filter(pk=course.pk)))
+        if slug:
+            item = json.loads(lines[0])
+            item['slug'] = slug
+            lines[0] = json.dumps(item) + '\n'
+        return lines
+
+    def content(self, course):
+        return {
+            'units': list(course.units.order_by('arrange')
+                          .values_list(*coursepack.UNIT_FIELDS)),
+            'lessons': list(Lesson.objects.filter(unit__course=course)
+                            .order_by('unit__arrange', 'arrange')
+                            .values_list('unit__arrange', 'host',
+                                         *coursepack.LESSON_FIELDS)),
+            'quizzes': list(Quiz.objects.filter(unit__course=course)
+                            .order_by('unit__arrange', 'pk')
+                            .values_list('unit__arrange',
+                                         *coursepack.QUIZ_FIELDS)),
+            'tags': sorted(course.tags.values_list('name', flat=True)),
+            'skills': sorted(course.skills_covered.values_list('name', flat=True)),
+            'stats': CourseStats.objects.filter(course=course).values_list(
+                'units', 'lessons').get(),
+        }
+
+    def test_round_trip(self):
+        copy, = coursepack.import_courses(self.export(self.course, 'copy'),
+                                          batch_size=2)
+        self.assertEqual(copy.slug, 'copy')
+        self.assertFalse(copy.is_approved)
+        self.assertEqual(copy.instructor_id, self.course.instructor_id)
+        self.assertEqual(self.content(copy), self.content(self.course))
+        self.assertTrue(self.content(copy)['quizzes'])
+
+    def test_duplicate_slug_imports_nothing(self):
+        other = Course.objects.exclude(pk=self.course.pk).get()
+        lines = self.export(self.course, 'copy') + self.export(other)
+        courses = Course.objects.count()
+        with self.assertRaisesMessage(coursepack.CoursePackError,
+                                      'already exists'):
+            coursepack.import_courses(lines)
+        self.assertEqual(Course.objects.count(), courses)
+        self.assertFalse(Course.objects.filter(slug='copy').exists())
@@ -0,0 +1,95 @@
+"""Resized variants of User.pic.
+
+Every uploaded picture `pp/<uuid>.<ext>` gets one JPEG and one WebP file per
+size in THUMBNAIL_SIZES, named `pp/thumbs/<uuid>_<size>.<jpg|webp>`. The work
+runs in a small thread pool after the transaction commits, so requests never
+wait for it; `User.pic_thumbs` is set once the files exist and until then
+`variant_url` falls back to the original picture.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+from . import models
+
+THUMBNAIL_SIZES = getattr(settings, 'THUMBNAIL_SIZES',
+                          {'small': 64, 'medium': 160, 'large': 450})
+
+FORMATS = (
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+)
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+
+logger = logging.getLogger(__name__)
+
+
+def variant_name(name, size, ext):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return os.path.join(os.path.dirname(name), 'thumbs',
+                        '%s_%s.%s' % (stem, size, ext))
+
+
+def variant_url(user, size='medium', ext='jpg'):
+    """URL of a `size` variant of the user picture, '' without picture"""
+    if not user.pic:
+        return ''
+    if not user.pic_thumbs:
+        return user.pic.url
+    return default_storage.url(variant_name(user.pic.name, size, ext))
+
+
+def generate(name):
+    """Write every variant of the stored picture `name`"""
+    with default_storage.open(name) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    for size, width in THUMBNAIL_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        for ext, fmt, options in FORMATS:
+            out = resized.convert('RGB') if fmt == 'JPEG' else resized
+            buffer = BytesIO()
+            out.save(buffer, fmt, **options)
+            target = variant_name(name, size, ext)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def process(user_id, name):
+    """Build the variants and flag the user, unless the picture changed
+    (the update also drops the cached user, see UserQuerySet)"""
+    generate(name)
+    models.User.objects.filter(pk=user_id, pic=name).update(pic_thumbs=True)
+
+
+def _process_in_thread(user_id, name):
+    close_old_connections()
+    try:
+        process(user_id, name)
+    except Exception:
+        # the pool would keep the exception in a future nobody reads
+        logger.exception('Thumbnails of %s failed', name)
+    finally:
+        connection.close()
+
+
+def schedule(user):
+    """Build the variants of `user.pic` after the current transaction"""
+    user_id, name = user.pk, user.pic.name
+    if getattr(settings, 'THUMBNAILS_ASYNC', True):
+        transaction.on_commit(
+            lambda: _pool.submit(_process_in_thread, user_id, name))
+    else:
+        transaction.on_commit(lambda: process(user_id, name))
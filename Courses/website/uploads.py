@@ -0,0 +1,215 @@
+"""Content-addressed storage of the CKEditor uploads.
+
+`ContentAddressedStorage` is the CKEDITOR_STORAGE_BACKEND: whatever name
+ckeditor_uploader asks for, a file is stored once under the SHA-256 of
+its content, `uploads/<d[:2]>/<d[2:4]>/<digest>.<ext>`, so the same
+screenshot pasted into fifty lessons is one file and an upload URL always
+points to the same bytes. Each blob has an `Upload` row and one
+`UploadLink` per saved object (of the models listing RICH_TEXT_FIELDS)
+linking to it, `Upload.refs` counting them; website/signals.py keeps them
+up to date and `gc_uploads` rebuilds them from the stored text and
+deletes the blobs nothing links to any more. Resized copies of an
+image blob (website/responsive.py) live next to it under
+`uploads/.variants/`, out of the CKEditor file browser.
+
+Since a blob never changes, `serve` sends them as immutable.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db.models import OuterRef
+from django.utils import timezone
+
+from . import staticfiles
+
+UPLOAD_PATH = getattr(settings, 'CKEDITOR_UPLOAD_PATH', 'uploads/')
+
+VARIANT_DIR = '.variants'
+
+# path of a blob or variant below UPLOAD_PATH, for the URLconf
+BLOB_PATH = (r'(?:\.variants/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}'
+             r'(?:_[0-9]+)?(?:\.[a-z0-9]{1,5})?')
+
+_ext = re.compile(r'^\.[a-z0-9]{1,5}$')
+_blob = re.compile(re.escape(UPLOAD_PATH.strip('/')) +
+                   r'/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\b')
+
+
+def blob_name(digest, ext):
+    return posixpath.join(UPLOAD_PATH, digest[:2], digest[2:4], digest + ext)
+
+
+def variant_dir(digest):
+    return posixpath.join(UPLOAD_PATH, VARIANT_DIR, digest[:2], digest[2:4])
+
+
+def variant_name(digest, width, ext):
+    return posixpath.join(variant_dir(digest), '%s_%d.%s' % (digest, width, ext))
+
+
+def blob_digest(url):
+    """Digest of the blob `url` points to, None for other URLs"""
+    match = _blob.search(url or '')
+    return match.group(1) if match else None
+
+
+def delete_blob(storage, digest, name):
+    """Delete a blob and its variants"""
+    storage.delete(name)
+    directory = variant_dir(digest)
+    if default_storage.exists(directory):
+        for filename in default_storage.listdir(directory)[1]:
+            if filename.startswith(digest + '_'):
+                default_storage.delete(posixpath.join(directory, filename))
+
+
+def file_digest(content):
+    sha = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage naming files after their content"""
+
+    def get_available_name(self, name, max_length=None):
+        # the stored name only depends on the content, see _save
+        return name
+
+    def _save(self, name, content):
+        digest = file_digest(content)
+        ext = os.path.splitext(name)[1].lower()
+        name = blob_name(digest, ext if _ext.match(ext) else '')
+        if not self.exists(name):
+            self._write(name, content)
+        Upload = apps.get_model('website', 'Upload')
+        Upload.objects.update_or_create(digest=digest, defaults={
+            'name': name, 'size': content.size, 'uploaded': timezone.now()})
+        return name
+
+    def _write(self, name, content):
+        """Write `content` to a temporary file of its own, then move it to
+        `name`: same content, so a concurrent writer of `name` is harmless"""
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp, self.file_permissions_mode)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def rich_text_models():
+    return [m for m in apps.get_app_config('website').get_models()
+            if hasattr(m, 'RICH_TEXT_FIELDS')]
+
+
+def referenced(*html):
+    """Digests of the blobs linked from `html`"""
+    return {digest for text in html if text for digest in _blob.findall(text)}
+
+
+def instance_blobs(instance):
+    return referenced(*(getattr(instance, f) for f in instance.RICH_TEXT_FIELDS))
+
+
+def _link_models():
+    return (apps.get_model('website', 'Upload'),
+            apps.get_model('website', 'UploadLink'))
+
+
+def recount(digests=None):
+    """Set the refs of the Uploads `digests` (all of them by default) to
+    their number of links"""
+    from .models import count_subquery
+    Upload, UploadLink = _link_models()
+    if digests is None:
+        uploads = Upload.objects.all()
+    elif digests:
+        uploads = Upload.objects.filter(digest__in=digests)
+    else:
+        return
+    uploads.update(refs=count_subquery(
+        UploadLink.objects.filter(upload=OuterRef('pk')).values('upload')))
+
+
+def link(instance):
+    """Bring the links of a saved object in line with its rich text"""
+    Upload, UploadLink = _link_models()
+    content_type = ContentType.objects.get_for_model(instance)
+    links = UploadLink.objects.filter(content_type=content_type,
+                                      object_id=instance.pk)
+    old = set(links.values_list('upload_id', flat=True))
+    new = instance_blobs(instance)
+    if old - new:
+        links.filter(upload__in=old - new).delete()
+    if new - old:
+        UploadLink.objects.bulk_create([
+            UploadLink(upload_id=digest, content_type=content_type,
+                       object_id=instance.pk)
+            for digest in Upload.objects.filter(digest__in=new - old)
+            .values_list('digest', flat=True)], ignore_conflicts=True)
+    recount(old ^ new)
+
+
+def unlink(instance):
+    """Forget the links of a deleted object"""
+    Upload, UploadLink = _link_models()
+    links = UploadLink.objects.filter(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk)
+    digests = list(links.values_list('upload_id', flat=True))
+    links.delete()
+    recount(digests)
+
+
+def linking_objects(digest):
+    """(model, [pk]) of the objects linking to a blob"""
+    Upload, UploadLink = _link_models()
+    pks = {}
+    for content_type_id, pk in UploadLink.objects.filter(
+            upload=digest).values_list('content_type', 'object_id'):
+        pks.setdefault(content_type_id, []).append(pk)
+    return [(ContentType.objects.get_for_id(ct).model_class(), ids)
+            for ct, ids in pks.items()]
+
+
+def scan_links():
+    """Set of (digest, content type id, pk) found in the stored rich text,
+    for the blobs that have an Upload"""
+    Upload, UploadLink = _link_models()
+    known = set(Upload.objects.values_list('digest', flat=True).iterator())
+    found = set()
+    for model in rich_text_models():
+        content_type = ContentType.objects.get_for_model(model).pk
+        rows = model._default_manager.values_list(
+            'pk', *model.RICH_TEXT_FIELDS)
+        for pk, *html in rows.iterator():
+            found.update((digest, content_type, pk)
+                         for digest in referenced(*html) if digest in known)
+    return found
+
+
+def serve(request, path):
+    """Serve a blob of MEDIA_ROOT/UPLOAD_PATH with a one year lifetime"""
+    response = staticfiles.serve(
+        request, posixpath.join(UPLOAD_PATH, path), settings.MEDIA_ROOT)
+    response['Cache-Control'] = staticfiles.IMMUTABLE
+    return response
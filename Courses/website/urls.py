@@ -23,12 +23,15 @@ urlpatterns = [
     path('discover/', views.discover, name='discover'),
     path('search/', views.CoursesSearchView.as_view(), name='search'),
     path('category/<slug:category>', views.categoryCourses, name='category'),
-    path('mycourses/', views.categoryCourses, name='myCourses'),
+    path('mycourses/', views.myCourses, name='myCourses'),
 
     # Overview the Course ::
 
     path('course/<slug:course>', views.courseView, name='course'),
+    path('course/<slug:course>/files', views.courseFiles, name='course_files'),
     path('course/<slug:course>/<int:unit>', views.unitView, name='unit'),
+    path('course/<slug:course>/<int:unit>/quizzes', views.unitQuizzes,
+         name='unit_quizzes'),
     path('course/<slug:course>/<int:unit>/<int:lesson>',
          views.LessonView.as_view(), name='lesson'),
 
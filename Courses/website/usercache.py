@@ -0,0 +1,91 @@
+"""Shared-cache copies of what every authenticated page needs.
+
+- the User row, read by `backends.CachedModelBackend` instead of the DB;
+- the user's enrollments (course id and rel_type) for the "My Courses"
+  menu, with the course slug/title cached per course.
+
+The receivers in website/signals.py drop the entries when a User, Rel or
+Course is saved or deleted, and `User.objects.update()` drops those of the
+users it changes.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import models
+
+EnrolledCourse = namedtuple('EnrolledCourse', 'id slug title rel_type')
+
+
+def _cache():
+    return caches[getattr(settings, 'USER_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+
+
+def _user_key(pk):
+    return 'user:%s' % pk
+
+
+def _enrolled_key(pk):
+    return 'user:%s:enrolled' % pk
+
+
+def _course_key(pk):
+    return 'course:%s:card' % pk
+
+
+def get_user(pk):
+    user = _cache().get(_user_key(pk))
+    if user is None:
+        user = models.User._default_manager.filter(pk=pk).first()
+        if user is not None:
+            _cache().set(_user_key(pk), user, _timeout())
+    return user
+
+
+def invalidate_user(pk):
+    invalidate_users([pk])
+
+
+def invalidate_users(pks):
+    keys = [key for pk in pks for key in (_user_key(pk), _enrolled_key(pk))]
+    if keys:
+        _cache().delete_many(keys)
+
+
+def invalidate_enrolled(pk):
+    _cache().delete(_enrolled_key(pk))
+
+
+def invalidate_course(pk):
+    _cache().delete(_course_key(pk))
+
+
+def enrolled_courses(user_pk):
+    """EnrolledCourse list of the user, last joined first"""
+    cache = _cache()
+    rels = cache.get(_enrolled_key(user_pk))
+    if rels is None:
+        rels = list(models.Rel.objects.filter(student=user_pk)
+                    .order_by('-join_date')
+                    .values_list('course_id', 'rel_type'))
+        cache.set(_enrolled_key(user_pk), rels, _timeout())
+    if not rels:
+        return []
+
+    keys = {_course_key(pk): pk for pk, _ in rels}
+    cards = {keys[k]: v for k, v in cache.get_many(keys).items()}
+    missing = [pk for pk, _ in rels if pk not in cards]
+    if missing:
+        fetched = {pk: (slug, title) for pk, slug, title in
+                   models.Course.objects.filter(pk__in=missing)
+                   .values_list('pk', 'slug', 'title')}
+        cache.set_many({_course_key(pk): card for pk, card in fetched.items()},
+                       _timeout())
+        cards.update(fetched)
+    return [EnrolledCourse(pk, *cards[pk], rel_type)
+            for pk, rel_type in rels if pk in cards]
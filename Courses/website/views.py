@@ -1,13 +1,15 @@
+import json
+
 from django.contrib.auth import login  # , logout, authenticate
 from django.contrib.auth.decorators import login_required
-from django.http import (Http404, HttpResponse, HttpResponseRedirect,
-                         JsonResponse)
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.views.generic import DetailView, ListView
 from django.views.generic.base import TemplateView, View
 
-from . import forms, models
+from . import attendance, downloads, forms, models, quizzes, search
 
 # Create your views here.
 
@@ -33,8 +35,6 @@ class RegisterView(View):
         if userForm.is_valid():
             user = userForm.save()
             user.set_password(userForm.cleaned_data['password'])
-            if 'pic' in request.FILES:
-                user.pic = request.FILES['pic']
             user.save()
             login(request, user)
             # userForm.clean()
@@ -59,14 +59,9 @@ def discover(request):
         - every small list have first 5 courses or less from one category
         - access Category object in DTL with get category var in every
           first element in small list
+        - all lists come from one query whatever the categories number
      """
-    categorys = models.Category.objects.only('pk')
-    c_courses = []
-    for cat in categorys:
-        course = models.Course.objects.filter(category=cat,
-                                              is_approved=True)[:5]
-        if len(course) > 2:
-            c_courses.append(course)
+    c_courses = models.Course.objects.discover(n=5, min_courses=3)
     return render(request, 'discover.html', {'quesyset': c_courses})
 
 
@@ -76,28 +71,52 @@ class CoursesSearchView(View):
         form = forms.SearchForm(request.GET)
 
         if form.is_valid():
-            qs = models.Course.objects.all()
+            qs = search.search_courses(form.cleaned_data['name'])
 
             return render(request, 'search.html', {'SearchForm': form,
                                                    'queryset': qs})
         else:
-            print('++++++++++why not shit ?++++++++++++++')
-            print(form.errors)
             return render(request, 'search.html', {'SearchForm': form})
 
 
 def categoryCourses(request, category):
 
-    queryset = get_object_or_404(models.Category, slug=category)
+    category = get_object_or_404(models.Category, slug=category)
+    queryset = category.get_courses().only('slug', 'title', 'category',
+                                           'intro_text_summary')
 
-    return render(request, 'category.html', {'queryset': queryset})
+    return render(request, 'category.html', {'category': category,
+                                             'queryset': queryset})
 
 
 def courseView(request, course):
-    course = get_object_or_404(models.Course, slug=course, is_approved=True)
+    course = get_object_or_404(
+        models.Course.objects.select_related('stats', 'instructor')
+        .prefetch_related('tags', 'skills_covered'),
+        slug=course, is_approved=True)
     return render(request, 'course.html', {'course': course})
 
 
+@login_required
+def courseFiles(request, course):
+    """Download the course attachments, for its students and instructor"""
+    course = get_object_or_404(models.Course.objects.only('files', 'instructor'),
+                               slug=course, is_approved=True)
+    allowed = (request.user.is_staff or course.instructor_id == request.user.pk
+               or models.Rel.objects.filter(student=request.user,
+                                            course=course).exists())
+    if not allowed or not course.files:
+        raise Http404
+    return downloads.file_response(request, course.files)
+
+
+@login_required
+def myCourses(request):
+    """Every enrollment of the user with its progress, in one query"""
+    rels = models.Rel.objects.dashboard(request.user)
+    return render(request, 'mycourses.html', {'rels': rels})
+
+
 @login_required
 def unitView(request, course, unit):
     unit = get_object_or_404(models.Unit, pk=unit,
@@ -105,35 +124,79 @@ def unitView(request, course, unit):
     return render(request, 'unit.html', {'unit': unit})
 
 
+@login_required
+@require_POST
+def unitQuizzes(request, course, unit):
+    """
+        Grade every quiz of a unit at once
+        - body is JSON : {"answers": {"<quiz_id>": "answer", ...}}
+        - answer is {"results": {"<quiz_id>": true/false}, "score": n}
+    """
+    rel = get_object_or_404(models.Rel.objects.select_related('course__stats'),
+                            student=request.user, course__slug=course,
+                            course__is_approved=True)
+    try:
+        answers = json.loads(request.body)['answers']
+        answers = {int(pk): answer for pk, answer in answers.items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'expected {"answers": {id: answer}}'},
+                            status=400)
+
+    results = quizzes.grade_unit(rel, unit, answers)
+    if results is None:
+        raise Http404
+    return JsonResponse({'results': results,
+                         'score': sum(results.values())})
+
+
 class LessonView(View):
     def get(self, request, *args, **kwargs):
 
-        lesson = get_object_or_404(models.Lesson,
-                                   pk=kwargs['course'],
-                                   unit__pk=kwargs['course'],
+        lesson = get_object_or_404(models.Lesson.objects.select_related('unit'),
+                                   pk=kwargs['lesson'],
+                                   unit__pk=kwargs['unit'],
                                    unit__course__slug=kwargs['course'])
 
-        rel = models.Rel.objects.get(student=self.request.user,
-                                     course=lesson.unit.course)
-        if lesson and rel:
+        rel = models.Rel.objects.select_related('course__stats').filter(
+            student=request.user.pk, course=lesson.unit.course_id).first()
+        if rel:
 
-            is_attend = rel.is_attended(l.id)
+            is_attend = rel.is_attended(lesson.id)
 
             return render(request, 'lesson.html',
-                          {'lesson': l, 'is_attend': is_attend})
+                          {'lesson': lesson, 'is_attend': is_attend})
 
         else:
             return redirect('course', course=kwargs['course'])
 
 
 @login_required
+@require_POST
 def attend(request, lesson_id):
-    lesson = models.Lesson.get(id=lesson_id)
-    course = lesson.unit.course
+    recorded, rejected = attendance.record(request.user, [lesson_id])
+    if rejected:
+        raise Http404
 
-    rel = get_object_or_404(models.Rel,
-                            student=request.user,
-                            course=course)
-    rel.lessons_attended.add(lesson)
+    return JsonResponse({'recorded': sorted(recorded)}, status=202)
 
-    return HttpResponse({'status': 202})
+
+@login_required
+@require_POST
+def attend_batch(request):
+    """
+        Record many attended lessons at once
+        - body is JSON : {"lessons": [lesson_id, ...]}
+        - safe to resend, lessons already attended are ignored
+    """
+    try:
+        lesson_ids = json.loads(request.body)['lessons']
+        lesson_ids = [int(pk) for pk in lesson_ids]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'expected {"lessons": [ids]}'},
+                            status=400)
+    if len(lesson_ids) > attendance.MAX_BATCH:
+        return JsonResponse({'error': 'too many lessons'}, status=400)
+
+    recorded, rejected = attendance.record(request.user, lesson_ids)
+    return JsonResponse({'recorded': sorted(recorded),
+                         'rejected': sorted(rejected)}, status=202)